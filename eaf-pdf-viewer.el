@@ -126,6 +126,22 @@ Non-nil means don't invert images."
   :type 'boolean
   :group 'eaf-pdf-viewer)
 
+(defcustom eaf-pdf-render-cache-mb 256
+  "The memory budget (in MB) of rendered page cache, visible pages are always kept."
+  :type 'integer
+  :group 'eaf-pdf-viewer)
+
+(defcustom eaf-pdf-render-processes 0
+  "The number of processes to render pages, 0 means render pages in a background thread."
+  :type 'integer
+  :group 'eaf-pdf-viewer)
+
+(defcustom eaf-pdf-disk-cache-mb 512
+  "The disk budget (in MB) of rendered page cache, reopened PDF paint from it before render finished.
+0 means disable disk cache."
+  :type 'integer
+  :group 'eaf-pdf-viewer)
+
 (defcustom eaf-pdf-marker-fontsize 8
   "The font size used by pdf marker."
   :type 'integer
@@ -154,7 +154,7 @@ class AppBuffer(Buffer):
         self.buffer_widget.theme_background_color = get_emacs_theme_background()
         self.buffer_widget.background_color = QColor(self.buffer_widget.theme_background_color)
         self.buffer_widget.fill_background()
-        self.buffer_widget.page_cache_pixmap_dict.clear()
+        self.buffer_widget.invalidate_page_cache(reason="theme")
         self.buffer_widget.update()
 
     def record_open_history(self):
@@ -213,6 +213,9 @@ class AppBuffer(Buffer):
             if os.path.exists(self.url):
                 os.remove(self.url)
 
+        self.buffer_widget.render_worker.stop()
+        self.buffer_widget.document_reloader.stop()
+
         super().destroy_buffer()
         sys.path.remove(os.path.dirname(__file__))
 
@@ -266,21 +269,25 @@ class AppBuffer(Buffer):
                 self.scroll_down()
 
     def save_session_data(self):
-        return "{0}:{1}:{2}:{3}:{4}:{5}".format(self.buffer_widget.scroll_offset,
-                                                self.buffer_widget.scale,
-                                                self.buffer_widget.read_mode,
-                                                self.buffer_widget.inverted_mode,
-                                                self.buffer_widget.rotation,
-                                                self.buffer_widget.start_page_index)
+        # Position in start page is saved too, scroll offset is wrong when page sizes are estimated at restore.
+        return "{0}:{1}:{2}:{3}:{4}:{5}:{6}".format(self.buffer_widget.scroll_offset,
+                                                    self.buffer_widget.scale,
+                                                    self.buffer_widget.read_mode,
+                                                    self.buffer_widget.inverted_mode,
+                                                    self.buffer_widget.rotation,
+                                                    self.buffer_widget.start_page_index,
+                                                    self.buffer_widget.top_y / self.buffer_widget.scale)
 
     def restore_session_data(self, session_data):
-        (scroll_offset, scale, read_mode, inverted_mode, rotation, start_page_index) = ("", "", "", "", "0", "0")
+        (scroll_offset, scale, read_mode, inverted_mode, rotation, start_page_index, page_y) = ("", "", "", "", "0", "0", None)
         if session_data.count(":") == 3:
             (scroll_offset, scale, read_mode, inverted_mode) = session_data.split(":")
         elif session_data.count(":") == 4:
             (scroll_offset, scale, read_mode, inverted_mode, rotation) = session_data.split(":")
         elif session_data.count(":") == 5:
             (scroll_offset, scale, read_mode, inverted_mode, rotation, start_page_index) = session_data.split(":")
+        elif session_data.count(":") == 6:
+            (scroll_offset, scale, read_mode, inverted_mode, rotation, start_page_index, page_y) = session_data.split(":")
         if self.synctex_info.page_num is None:
             self.buffer_widget.scroll_offset = float(scroll_offset)
             self.buffer_widget.scroll_offset_before_presentation = float(scroll_offset)
@@ -296,6 +303,9 @@ class AppBuffer(Buffer):
         self.buffer_widget.start_page_index = int(start_page_index)
         self.buffer_widget.presentation_mode = read_mode == "fit_to_presentation"
 
+        if self.synctex_info.page_num is None and page_y is not None and read_mode != "fit_to_presentation":
+            self.buffer_widget.restore_page_position(int(start_page_index), float(page_y))
+
         if read_mode == "fit_to_presentation":
             QTimer().singleShot(10, self.enable_fullscreen)
 
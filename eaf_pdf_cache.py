@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2018 Andy Stewart
+#
+# Author:     Andy Stewart <lazycat.manatee@gmail.com>
+# Maintainer: Andy Stewart <lazycat.manatee@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import traceback
+from collections import OrderedDict
+
+
+def pixmap_bytes(pixmap):
+    '''Memory used by QPixmap, 4 bytes per pixel.'''
+    return pixmap.width() * pixmap.height() * 4
+
+
+class PdfPixmapCache():
+    '''
+    LRU cache of page pixmaps, limited by memory budget.
+
+    Key is a tuple that starts with page index, a page can have several entries
+    (different scale, rotation or render mode).
+    Pinned keys (visible pages) are never evicted.
+    '''
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+
+        self._entries = OrderedDict()    # key -> pixmap, least recently used first
+        self._page_keys = {}    # page index -> set of keys
+        self._pinned = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = {}    # reason -> count of invalidated entries
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def page_keys(self, index):
+        return list(self._page_keys.get(index, ()))
+
+    def get(self, key):
+        pixmap = self._entries.get(key)
+        if pixmap is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return pixmap
+
+    def peek(self, key):
+        '''Get pixmap without touching LRU order and counters.'''
+        return self._entries.get(key)
+
+    def put(self, key, pixmap):
+        self.pop(key)
+        self._entries[key] = pixmap
+        self._page_keys.setdefault(key[0], set()).add(key)
+        self.total_bytes += pixmap_bytes(pixmap)
+        self._evict(key)
+
+    def pop(self, key):
+        pixmap = self._entries.pop(key, None)
+        if pixmap is not None:
+            self.total_bytes -= pixmap_bytes(pixmap)
+
+            page_keys = self._page_keys[key[0]]
+            page_keys.discard(key)
+            if not page_keys:
+                self._page_keys.pop(key[0])
+        return pixmap
+
+    def pop_page(self, index):
+        '''Remove all entries of page.'''
+        for key in self.page_keys(index):
+            self.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._page_keys.clear()
+        self.total_bytes = 0
+
+    def invalidate(self, pages=None, reason="unknown"):
+        '''
+        Remove entries of pages, remove all entries if pages is None.
+        reason (such as annotation, theme, geometry) is counted in stats.
+        '''
+        if pages is None:
+            count = len(self._entries)
+            self.clear()
+        else:
+            count = 0
+            for index in pages:
+                count += len(self._page_keys.get(index, ()))
+                self.pop_page(index)
+
+        self.invalidations[reason] = self.invalidations.get(reason, 0) + count
+        return count
+
+    def pin(self, keys):
+        '''Replace pinned keys, then evict entries that over budget.'''
+        self._pinned = set(keys)
+        self._evict()
+
+    def _evict(self, keep_key=None):
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        for key in list(self._entries.keys()):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key in self._pinned or key == keep_key:
+                continue
+            self.pop(key)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": dict(self.invalidations),
+        }
+
+
+class PdfLruCache():
+    '''
+    LRU cache limited by entry count, for objects that size is unknown (display lists, pages).
+    '''
+    def __init__(self, max_count):
+        self.max_count = max_count
+
+        self._entries = OrderedDict()    # least recently used first
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        return list(self._entries.keys())
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def peek(self, key):
+        '''Get value without touching LRU order and counters.'''
+        return self._entries.get(key)
+
+    def put(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+
+        while len(self._entries) > self.max_count:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        return self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_count": self.max_count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def file_fingerprint(path, sample_size=1024 * 1024):
+    '''
+    Fingerprint of file content and mtime.
+    Hash head and tail of file with file size, hashing whole big PDF is too slow when open.
+    '''
+    stat = os.stat(path)
+    sha = hashlib.sha1("{}:{}".format(stat.st_size, stat.st_mtime_ns).encode())
+    with open(path, "rb") as f:
+        sha.update(f.read(sample_size))
+        if stat.st_size > sample_size:
+            f.seek(max(sample_size, stat.st_size - sample_size))
+            sha.update(f.read(sample_size))
+    return sha.hexdigest()
+
+
+class PdfDiskCache():
+    '''
+    Page rasters saved on disk, make reopened document paint before render finished.
+
+    Files are stored in cache_dir/fingerprint/, the oldest files are removed when over size budget.
+    Write and eviction run in background thread.
+    Render worker loads and saves rasters with fingerprint of its task, file of other document version is never used.
+    '''
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fingerprint = None
+
+        self._files = set()    # file names of current fingerprint, added after file is written
+        self._pending = set()    # (fingerprint, file name) queued to write
+        self._total_bytes = None    # computed by writer thread
+        self._queue = queue.Queue()
+
+        if self.is_enabled():
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def is_enabled(self):
+        return self.max_bytes > 0
+
+    def set_document(self, fingerprint):
+        '''Switch to fingerprint of document, call it when document loaded or reloaded.'''
+        self.fingerprint = None
+        self._files = set()
+        if not self.is_enabled() or fingerprint is None:
+            return
+
+        try:
+            document_dir = os.path.join(self.cache_dir, fingerprint)
+            if os.path.isdir(document_dir):
+                self._files = set(os.listdir(document_dir))
+            self.fingerprint = fingerprint
+        except OSError:
+            pass
+
+    def get_file_name(self, key):
+        return "{}_{}.png".format(key[0], hashlib.sha1(repr(key[1:]).encode()).hexdigest()[:16])
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, self.fingerprint, self.get_file_name(key))
+
+    def __contains__(self, key):
+        return self.fingerprint is not None and self.get_file_name(key) in self._files
+
+    def load(self, key, fingerprint=None):
+        '''
+        Return QImage of key, or None if not cached, or fingerprint isn't current document.
+        It decodes image file, call it in worker thread.
+        '''
+        from PyQt6.QtGui import QImage
+
+        document_fingerprint = self.fingerprint
+        if key not in self or (fingerprint is not None and fingerprint != document_fingerprint):
+            return None
+
+        path = os.path.join(self.cache_dir, document_fingerprint, self.get_file_name(key))
+        image = QImage(path)
+        if image.isNull():
+            self._files.discard(self.get_file_name(key))
+            return None
+
+        # Update mtime, it's the LRU order of eviction.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return image
+
+    def save(self, key, image, fingerprint=None):
+        '''Save QImage of key in background, image must not be changed after.'''
+        document_fingerprint = self.fingerprint
+        if (document_fingerprint is None or key in self or
+            (fingerprint is not None and fingerprint != document_fingerprint)):
+            return
+
+        file_key = (document_fingerprint, self.get_file_name(key))
+        if file_key in self._pending:
+            return
+
+        self._pending.add(file_key)
+        self._queue.put((file_key, image))
+
+    def _run(self):
+        while True:
+            file_key, image = self._queue.get()
+            document_fingerprint, name = file_key
+            path = os.path.join(self.cache_dir, document_fingerprint, name)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+                # Write temp file first, reader never see half written file.
+                temp_path = path + ".tmp"
+                if not image.save(temp_path, "PNG", 80):
+                    continue
+                os.replace(temp_path, path)
+
+                # File can be loaded now, if document isn't switched while writing.
+                if document_fingerprint == self.fingerprint:
+                    self._files.add(name)
+
+                if self._total_bytes is None:
+                    self._total_bytes = sum(size for (_, _, size) in self._list_files())
+                else:
+                    self._total_bytes += os.path.getsize(path)
+
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+            except OSError:
+                traceback.print_exc()
+            finally:
+                self._pending.discard(file_key)
+
+    def _list_files(self):
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+        return files
+
+    def _evict(self):
+        # Evict to 90% of budget, avoid scan cache directory after every write.
+        files = sorted(self._list_files())
+        self._total_bytes = sum(size for (_, _, size) in files)
+        for (_, path, size) in files:
+            if self._total_bytes <= self.max_bytes * 0.9:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._total_bytes -= size
+
+            document_dir = os.path.dirname(path)
+            if os.path.basename(document_dir) == self.fingerprint:
+                self._files.discard(os.path.basename(path))
+            elif not os.listdir(document_dir):
+                os.rmdir(document_dir)
+
+
+class PdfPageMetaCache():
+    '''
+    Per-page metadata that only depends on page content (such as image rects), saved as JSON file
+    of document fingerprint.
+
+    Key is tuple of page index and page clip, value is JSON compatible.
+    It's used by render threads, access is locked.
+    Background scan can pass fingerprint of its document, value isn't read or written if document switched.
+    '''
+    def __init__(self, cache_dir, save_delay=2):
+        self.cache_dir = cache_dir
+        self.save_delay = save_delay
+        self.path = None
+        self.fingerprint = None
+
+        self._data = {}
+        self._lock = threading.Lock()
+        self._save_timer = None
+
+    def set_document(self, fingerprint):
+        with self._lock:
+            self._data = {}
+            self.fingerprint = fingerprint
+            self.path = os.path.join(self.cache_dir, fingerprint + ".json") if fingerprint else None
+            if self.path is None or not os.path.exists(self.path):
+                return
+
+            try:
+                with open(self.path, "r") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+
+    def _get_key(self, key):
+        return ":".join(map(str, key))
+
+    def get(self, key, name, fingerprint=None):
+        with self._lock:
+            if fingerprint is not None and fingerprint != self.fingerprint:
+                return None
+            return self._data.get(self._get_key(key), {}).get(name)
+
+    def put(self, key, name, value, fingerprint=None):
+        with self._lock:
+            if fingerprint is not None and fingerprint != self.fingerprint:
+                return
+            self._data.setdefault(self._get_key(key), {})[name] = value
+
+            # Save after a while, merge writes of rendered pages.
+            if self.path is not None and self._save_timer is None:
+                self._save_timer = threading.Timer(self.save_delay, self.save)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def save(self):
+        with self._lock:
+            self._save_timer = None
+            if self.path is None:
+                return
+
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                temp_path = self.path + ".tmp"
+                with open(temp_path, "w") as f:
+                    json.dump(self._data, f)
+                os.replace(temp_path, self.path)
+            except OSError:
+                traceback.print_exc()
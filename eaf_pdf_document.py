@@ -18,85 +18,366 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import functools
+import hashlib
 import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
 import fitz
+import numpy as np
 from core.utils import PostGui, get_emacs_vars, message_to_emacs
-from eaf_pdf_page import PdfPage
+from eaf_pdf_cache import PdfLruCache, file_fingerprint
+from eaf_pdf_page import PdfPage, get_page_raster_rect, get_page_text_rect
+
+def get_page_fingerprint(document, index):
+    '''
+    Fingerprint of page content, resources, geometry, links and annots, pages that fingerprint unchanged
+    are kept when document reloaded. Raw streams are hashed, don't decompress them.
+
+    Xref numbers are never hashed, LaTeX recompile that adds one object renumbers objects of following pages.
+    Return None if page can't be fingerprinted.
+    '''
+    def stream_digest(xref):
+        return hashlib.sha1(document.xref_stream_raw(xref) or b"").hexdigest() if xref > 0 else None
+
+    try:
+        page = document[index]
+        sha = hashlib.sha1(repr((page.rotation, tuple(page.mediabox), tuple(page.cropbox))).encode())
+        for xref in page.get_contents():
+            sha.update(document.xref_stream_raw(xref) or b"")
+
+        # Subset prefix of basefont changes with used glyphs.
+        for (_, ext, font_type, basefont, name, encoding) in (font[:6] for font in page.get_fonts(full=True)):
+            sha.update(repr((ext, font_type, basefont, name, encoding)).encode())
+        for (xref, smask, width, height, bpc, colorspace, _, name, image_filter) in \
+                (image[:9] for image in page.get_images(full=True)):
+            sha.update(repr((width, height, bpc, colorspace, name, image_filter,
+                             stream_digest(xref), stream_digest(smask))).encode())
+        for xobject in page.get_xobjects():
+            sha.update(repr((xobject[1], tuple(xobject[3]))).encode())
+            sha.update(document.xref_stream_raw(xobject[0]) or b"")
+
+        for annot in page.annots():
+            sha.update(repr((annot.type, tuple(annot.rect), annot.info.get("content"), annot.colors,
+                             annot.vertices)).encode())
+        for link in page.get_links():
+            sha.update(repr(sorted((key, value) for (key, value) in link.items() if key not in ("xref", "id"))).encode())
+        return sha.hexdigest()
+    except Exception:
+        return None
+
+def get_page_sizes(document):
+    '''Return widths and heights of all pages of PDF document.'''
+    widths = []
+    heights = []
+    for index in range(document.page_count):
+        rect = document.page_cropbox(index)
+        widths.append(rect.width)
+        heights.append(rect.height)
+    return widths, heights
+
+def get_sample_pages(page_count, sample_count):
+    '''Return sample_count page indexes that spread evenly in document, or all pages if document is small.'''
+    if page_count <= sample_count:
+        return list(range(page_count))
+    return sorted(set(np.linspace(0, page_count - 1, sample_count).astype(int).tolist()))
+
+def get_raster_rects_in_process(url, indexes):
+    '''Find content rects of pages from thumbnails in scan process, return list of rect tuple or None.'''
+    document = fitz.open(url)
+    rects = []
+    for index in indexes:
+        rect = get_page_raster_rect(document[index])
+        rects.append(tuple(rect) if rect is not None else None)
+    document.close()
+    return rects
+
+def scan_trim_clip(url, fingerprint, callback, pages=None, clip=None, raster=False, sample_count=100, process_count=2,
+                   meta_cache=None, chunk_size=16):
+    '''
+    Compute clip of trim margin mode in background thread, it's union of content rects of all pages.
+
+    Pages sampled evenly are scanned first, callback(clip, raster_pages, False) is called with their clip,
+    then callback(clip, raster_pages, True) is called when all pages scanned, if clip grows or not.
+    If pages is not None, only pages are scanned and their rects are added to clip (clip of other pages),
+    such as changed pages of reloaded document, callback(clip, raster_pages, True) is called only.
+    clip is None if no page has content. Callback is called only if file is still the version of fingerprint.
+
+    Content rect of page is its text blocks. Pages without text (scanned pages) are returned as raster_pages,
+    scan them with raster=True when trim margin is needed, their content is detected from thumbnails.
+    Thumbnails are rendered in process_count processes, GUI process don't render them.
+    Their rects are saved in meta_cache, an interrupted scan of big scanned book don't render them again.
+    '''
+    def union(clip, rect):
+        if clip is None or rect is None:
+            return clip or rect
+        return clip | rect
+
+    def get_cached_rect(index):
+        '''Return True and content rect of page found from thumbnail before, or False if not found.'''
+        rect = meta_cache.get((index, ), "content_rect", fingerprint) if meta_cache is not None else None
+        if rect is None:
+            return False, None
+        # Empty list is blank page.
+        return True, fitz.Rect(rect) if rect else None
+
+    def scan_pages(document, indexes, clip):
+        raster_pages = []
+        for index in indexes:
+            rect = get_page_text_rect(document[index])
+            if rect is None:
+                is_cached, rect = get_cached_rect(index)
+                if not is_cached:
+                    raster_pages.append(index)
+            clip = union(clip, rect)
+        return clip, raster_pages
+
+    def scan_raster_pages(indexes, clip):
+        raster_pages = []
+        for index in indexes:
+            is_cached, rect = get_cached_rect(index)
+            if is_cached:
+                clip = union(clip, rect)
+            else:
+                raster_pages.append(index)
+        if not raster_pages:
+            return clip, []
+
+        # Spawn processes, fork is unsafe in Qt application.
+        with ProcessPoolExecutor(max_workers=process_count, mp_context=get_context("spawn")) as executor:
+            chunks = [raster_pages[i:i + chunk_size] for i in range(0, len(raster_pages), chunk_size)]
+            for (chunk, rects) in zip(chunks, executor.map(get_raster_rects_in_process, [url] * len(chunks), chunks)):
+                for (index, rect) in zip(chunk, rects):
+                    rect = fitz.Rect(rect) if rect is not None else None
+                    if meta_cache is not None and fingerprint is not None:
+                        meta_cache.put((index, ), "content_rect", list(rect) if rect is not None else [], fingerprint)
+                    clip = union(clip, rect)
+        return clip, []
+
+    def run():
+        try:
+            if raster:
+                result, raster_pages = scan_raster_pages(pages, clip)
+            else:
+                document = fitz.open(url)
+                if pages is not None:
+                    result, raster_pages = scan_pages(document, [index for index in pages if index < document.page_count],
+                                                      clip)
+                else:
+                    sample_pages = get_sample_pages(document.page_count, sample_count)
+                    result, raster_pages = scan_pages(document, sample_pages, None)
+
+                    if len(sample_pages) < document.page_count:
+                        if fingerprint is None or file_fingerprint(url) == fingerprint:
+                            callback(result, raster_pages, False)
+
+                        sample_pages = set(sample_pages)
+                        result, other_raster_pages = scan_pages(document, [index for index in range(document.page_count)
+                                                                           if index not in sample_pages], result)
+                        raster_pages = sorted(raster_pages + other_raster_pages)
+                document.close()
+
+            if fingerprint is None or file_fingerprint(url) == fingerprint:
+                callback(result, raster_pages, True)
+        except Exception:
+            traceback.print_exc()
+
+    threading.Thread(target=run, daemon=True).start()
+
+def load_page_sizes(url, fingerprint, callback):
+    '''
+    Read page sizes of PDF url in background thread, with its own document.
+    callback(widths, heights) is called in that thread if file is still the version of fingerprint.
+    '''
+    def run():
+        try:
+            document = fitz.open(url)
+            widths, heights = get_page_sizes(document)
+            document.close()
+            if fingerprint is None or file_fingerprint(url) == fingerprint:
+                callback(widths, heights)
+        except Exception:
+            traceback.print_exc()
+
+    threading.Thread(target=run, daemon=True).start()
+
+class PdfPageGeometry():
+    '''
+    Page sizes and scroll offsets of pages, backed by numpy arrays.
+
+    widths and heights are unrotated page sizes in points.
+    Offsets are recomputed only when layout (scale, padding, rotation or page clip) changed,
+    pages are swapped by rotation, and all have clip size in trim margin mode.
+    '''
+    def __init__(self, widths, heights):
+        self.widths = np.array(widths, dtype=np.float64)
+        self.heights = np.array(heights, dtype=np.float64)
+
+        self._layout = None
+        self._render_widths = None
+        self._render_heights = None
+        self._offsets = None    # offsets[i] is scroll offset of top of page i, offsets[-1] is end of last padding
+
+    def __len__(self):
+        return len(self.widths)
+
+    def is_same_sizes(self, widths, heights):
+        return np.array_equal(self.widths, widths) and np.array_equal(self.heights, heights)
+
+    def set_page_size(self, index, width, height):
+        self.widths[index] = width
+        self.heights[index] = height
+        self._layout = None
+
+    def update(self, scale, padding, rotation=0, clip=None):
+        layout = (scale, padding, rotation % 180 != 0, None if clip is None else (clip.width, clip.height))
+        if layout == self._layout:
+            return
+
+        self._layout = layout
+        if clip is None:
+            widths, heights = self.widths, self.heights
+        else:
+            widths, heights = np.full(len(self), clip.width), np.full(len(self), clip.height)
+        if rotation % 180 != 0:
+            widths, heights = heights, widths
+
+        self._render_widths = widths
+        self._render_heights = heights
+        self._offsets = np.concatenate(([0.0], np.cumsum(heights * scale + padding)))
+
+    def has_layout(self):
+        return self._layout is not None
+
+    def get_scale(self):
+        return self._layout[0]
+
+    def get_page_size(self, index):
+        '''Return size of page after rotation and clip, in points.'''
+        return float(self._render_widths[index]), float(self._render_heights[index])
+
+    def get_page_offset(self, index):
+        '''Return scroll offset of top of page, index can be page count.'''
+        return float(self._offsets[index])
+
+    def get_total_height(self):
+        '''Return height of all pages, without padding after last page.'''
+        return float(self._offsets[-1]) - self._layout[1]
+
+    def find_page(self, y):
+        '''Return index of page at scroll offset y, padding belongs to page above, page count if y is after the end.'''
+        return max(int(np.searchsorted(self._offsets, y, side="left")) - 1, 0)
 
 class PdfDocument(fitz.Document):
-    def __init__(self, document):
+    def __init__(self, document, page_cache_count=64):
         self.document = document
         self._is_trim_margin = False
-        self._page_cache_dict = {}
+        # Parsed pages (text layer, links, annots), it's independent of page pixmap cache,
+        # hover on visited page don't extract text again.
+        self._page_cache = PdfLruCache(page_cache_count)
+        # Clip of all pages in trim margin mode, scanned in background by scan_trim_clip.
         self._document_page_clip = None
-        self._document_page_change = lambda rect: None
+        self._is_trim_clip_scanned = False
+        # Pages without text, they aren't in clip until scanned from thumbnails.
+        self._raster_pages = []
+        self._document_page_change = lambda: None
+        # Cropboxes of pages in file, PdfPage changes cropbox of page object to its clip.
+        self._page_cropboxes = {}
 
     def __getattr__(self, attr):
         return getattr(self.document, attr)
 
     def __getitem__(self, index):
-        if index in self._page_cache_dict:
-            page = self._page_cache_dict[index]
-            if not self._is_trim_margin:
-                return page
-
-            if page.cropbox == self._document_page_clip:
-                return page
+        # Page parsed in other trim margin mode has text layer relative to other clip.
+        clip = self.get_page_render_clip(index)
+        page = self._page_cache.get(index)
+        if page is not None and (clip is None or page.clip == clip):
+            return page
 
-        page = PdfPage(self.document[index], index, self.document.is_pdf)
+        # Keep page, avoid rebuild page text layer when hover on it.
+        page = PdfPage(self.document[index], index, self.document.is_pdf, clip)
+        self._page_cache.put(index, page)
+        return page
 
-        # udpate the page clip
-        new_rect_clip = self.computer_page_clip(page.get_tight_margin_rect(), self._document_page_clip)
-        if new_rect_clip != self._document_page_clip:
-            self._document_page_clip = new_rect_clip
-            if self._is_trim_margin:
-                self._document_page_change(new_rect_clip)
+    def set_trim_clip(self, clip, is_scanned=True):
+        '''
+        Set clip of trim margin mode, is_scanned is False if clip is of sampled pages.
+        Page size changed only if clip changed.
+        '''
+        self._is_trim_clip_scanned = is_scanned
+        if clip == self._document_page_clip:
+            return
 
+        self._document_page_clip = clip
         if self._is_trim_margin:
-            return PdfPage(self.document[index], index, self.document.is_pdf, self._document_page_clip)
+            self._document_page_change()
 
-        return page
+    def inherit_pages(self, old_document, changed_pages):
+        '''
+        Take trim margin state and parsed pages of old_document (document before reloaded),
+        text layer of unchanged pages isn't extracted again.
+        '''
+        changed_pages = set(changed_pages)
+
+        # Changed pages are scanned again.
+        self._is_trim_margin = old_document._is_trim_margin
+        self._document_page_clip = old_document._document_page_clip
+        self._is_trim_clip_scanned = old_document._is_trim_clip_scanned
+        self._raster_pages = [index for index in old_document._raster_pages
+                              if index not in changed_pages and index < self.page_count]
 
-    def computer_page_clip(self, *args):
-        '''Update the bestest max page clip.'''
-        dr = None
-        for r in args:
-            if r is None:
+        for index in old_document.get_cache_indexes():
+            old_page = old_document.get_cached_page(index)
+            if index in changed_pages or index >= self.page_count:
                 continue
-            if dr is None:
-                dr = r
+
+            # Text layer is relative to page clip.
+            clip = self.get_page_render_clip(index)
+            if clip is not None and old_page.clip != clip:
                 continue
-            x0 = min(r.x0, dr.x0)
-            y0 = min(r.y0, dr.y0)
-            x1 = max(r.x1, dr.x1)
-            y1 = max(r.y1, dr.y1)
-            dr = fitz.Rect(x0, y0, x1, y1)
-        return dr
-
-    def reload_document(self, url):
-        self._page_cache_dict = {}
-        try:
-            self.document = fitz.open(url)
 
-            if self.watch_callback is not None:
-                self.watch_callback(url)
-            self.file_changed_timer.stop()
-        except Exception:
-            self.watch_callback = None
+            page = PdfPage(self.document[index], index, self.document.is_pdf, clip)
+            page.inherit_text_layer(old_page)
+            self._page_cache.put(index, page)
+
+    def get_page_size(self, index):
+        rect = self.get_page_cropbox(index) if self.is_pdf else self[index].clip
+        return rect.width, rect.height
 
-            if os.path.exists(url):
-                self.file_changed_timer.start()
-                print("Failed to reload PDF file: " + url)
+    def get_page_cropbox(self, index):
+        '''Return cropbox of PDF page in file, it isn't changed by clip of trim margin mode.'''
+        cropbox = self._page_cropboxes.get(index)
+        if cropbox is None:
+            cropbox = self._page_cropboxes[index] = self.document.page_cropbox(index)
+        return cropbox
 
-    def cache_page(self, index, page):
-        self._page_cache_dict[index] = page
+    def get_page_render_clip(self, index):
+        '''Return clip of page, trim margin clip in trim margin mode, cropbox in file otherwise.'''
+        if not self.is_pdf:
+            return self.get_page_clip()
+
+        # Record cropbox before PdfPage sets trim clip to cropbox of page object.
+        cropbox = self.get_page_cropbox(index)
+        clip = self.get_page_clip()
+        return clip if clip is not None else cropbox
 
     def remove_cache(self, index):
-        self._page_cache_dict.pop(index)
+        self._page_cache.pop(index)
+
+    def get_cached_page(self, index):
+        return self._page_cache.peek(index)
+
+    def get_cache_indexes(self):
+        return self._page_cache.keys()
 
     def reset_cache(self):
-        self._page_cache_dict.clear()
+        self._page_cache.clear()
+
+    def get_page_cache_stats(self):
+        return self._page_cache.stats()
 
     def watch_file(self, path, callback):
         '''
@@ -113,54 +394,75 @@ class PdfDocument(fitz.Document):
     def handle_file_changed(self, path):
         '''
         Use the QFileSystemWatcher watch file changed. If the watch file have been remove or rename,
-        this watch will auto remove.
+        this watch will auto remove, it's added again when new document loaded.
         '''
-        from PyQt6.QtCore import QTimer
-        if path in self.file_changed_wacher.files():
-            self.file_changed_timer = QTimer()
-            self.file_changed_timer.setInterval(500)
-            self.file_changed_timer.setSingleShot(True)
-            reload_callback = functools.partial(self.reload_document, path)
-            self.file_changed_timer.timeout.connect(reload_callback)
-            self.file_changed_timer.start()
-
-            notify, = get_emacs_vars(["eaf-pdf-notify-file-changed"])
-            if notify:
-                message_to_emacs("Detected that {} has been changed. Refreshing buffer...".format(path))
+        self.watch_callback(path)
+
+        notify, = get_emacs_vars(["eaf-pdf-notify-file-changed"])
+        if notify:
+            message_to_emacs("Detected that {} has been changed. Refreshing buffer...".format(path))
 
     def toggle_trim_margin(self):
         self._is_trim_margin = not self._is_trim_margin
 
+    def is_trim_margin(self):
+        return self._is_trim_margin
+
+    def get_raster_pages(self):
+        return self._raster_pages
+
+    def set_raster_pages(self, pages):
+        self._raster_pages = pages
+
+    def get_trim_clip(self):
+        '''Return clip of trim margin mode, and if all pages are scanned.'''
+        return self._document_page_clip, self._is_trim_clip_scanned
+
+    def get_page_clip(self):
+        '''Return the clip used by all pages in trim margin mode, None otherwise.'''
+        if self._is_trim_margin:
+            return self._document_page_clip
+        return None
+
     def get_page_width(self):
         if self.is_pdf:
-            if self._is_trim_margin:
+            if self._is_trim_margin and self._document_page_clip is not None:
                 return self._document_page_clip.width
-            return self.document.page_cropbox(0).width
+            return self.get_page_cropbox(0).width
         else:
             return self[0].clip.width
 
     def get_page_height(self):
         if self.is_pdf:
-            if self._is_trim_margin:
+            if self._is_trim_margin and self._document_page_clip is not None:
                 return self._document_page_clip.height
-            return self.document.page_cropbox(0).height
+            return self.get_page_cropbox(0).height
         else:
             return self[0].clip.height
         
     def get_all_widths_heights(self):
-        heights = []
         page_cnts = self.document.page_count
         if not self.document.is_pdf:
             height = self[0].clip.height
             width = self[0].clip.width
             return [width] * page_cnts, [height] * page_cnts
-        heights = []
-        widths = []
-        for i in range(page_cnts):
-            heights.append(self.document.page_cropbox(i).height)
-            widths.append(self.document.page_cropbox(i).width)
+        widths, heights = get_page_sizes(self.document)
+        for (index, cropbox) in self._page_cropboxes.items():
+            widths[index], heights[index] = cropbox.width, cropbox.height
         return widths, heights
 
+    def get_estimated_widths_heights(self):
+        '''
+        Return page sizes that all pages have the size of first page, and if it's exact.
+        Reading cropbox of all pages is slow for big PDF, read them in background with load_page_sizes.
+        '''
+        page_cnts = self.document.page_count
+        if not self.document.is_pdf or page_cnts == 1:
+            return self.get_all_widths_heights() + (True,)
+
+        width, height = self.get_page_size(0)
+        return [width] * page_cnts, [height] * page_cnts, False
+
     def watch_page_size_change(self, callback):
         self._document_page_change = callback
 
@@ -174,4 +476,182 @@ class PdfDocument(fitz.Document):
                 if len(line) > 1:
                     self.text_list.append(f"{i + 1}: {line}")
         return "\n".join(self.text_list)
-            
\ No newline at end of file
+
+
+def get_changed_pages(old_fingerprints, new_fingerprints):
+    '''
+    Return indexes of pages that fingerprint changed, pages that only exist in one version are included.
+    Return None if fingerprints of any version are unknown.
+    '''
+    if old_fingerprints is None or new_fingerprints is None:
+        return None
+
+    changed_pages = []
+    for index in range(max(len(old_fingerprints), len(new_fingerprints))):
+        if (index >= len(old_fingerprints) or index >= len(new_fingerprints) or
+            new_fingerprints[index] is None or new_fingerprints[index] != old_fingerprints[index]):
+            changed_pages.append(index)
+    return changed_pages
+
+
+class PdfDocumentReloader():
+    '''
+    Open changed file in background thread, old document keeps serving paints until new one is ready.
+
+    File is opened after its size and mtime are stable and it looks complete,
+    file that LaTeX is still writing is never shown.
+    File that MuPDF repairs, or has bytes after %%EOF, is opened after it's stable for repair_delay seconds.
+    Pages are compared with the version shown in GUI by fingerprint, then
+    callback(document, file_fingerprint, changed_pages) is called in reloader thread,
+    changed_pages is None if pages can't be compared. Callback should swap document in GUI thread.
+    '''
+    def __init__(self, url, callback, stable_delay=0.15, repair_delay=1.0, timeout=10):
+        self.url = url
+        self.callback = callback
+        self.stable_delay = stable_delay
+        self.repair_delay = repair_delay
+        self.timeout = timeout
+
+        # Fingerprints of the version shown in GUI, None if unknown.
+        self._file_fingerprint = None
+        self._page_fingerprints = None
+
+        self._need_fingerprint = False
+        self._need_reload = False
+        self._running = True
+        self._condition = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def set_document(self, fingerprint):
+        '''Call it when document loaded in GUI thread, fingerprint is file fingerprint of loaded document.'''
+        with self._condition:
+            if fingerprint is not None and fingerprint == self._file_fingerprint:
+                # Loaded document is the one that reloader opened.
+                return
+
+            self._file_fingerprint = fingerprint
+            self._page_fingerprints = None
+            self._need_fingerprint = fingerprint is not None
+            self._condition.notify()
+
+    def request(self):
+        '''File changed, reload it after it's written completely.'''
+        with self._condition:
+            self._need_reload = True
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._need_reload and not self._need_fingerprint:
+                    self._condition.wait()
+
+                if not self._running:
+                    break
+
+                # Fingerprint of loaded version is useless if file changed again.
+                need_reload = self._need_reload
+                self._need_reload = False
+                self._need_fingerprint = False
+                fingerprint = self._file_fingerprint
+
+            try:
+                if need_reload:
+                    self._reload()
+                else:
+                    self._fingerprint_document(fingerprint)
+            except Exception:
+                traceback.print_exc()
+
+    def _get_page_fingerprints(self, document):
+        if not document.is_pdf:
+            return None
+        return [get_page_fingerprint(document, index) for index in range(document.page_count)]
+
+    def _fingerprint_document(self, fingerprint):
+        document = fitz.open(self.url)
+        page_fingerprints = self._get_page_fingerprints(document)
+        document.close()
+
+        # Keep page fingerprints only if file is still the version loaded by GUI.
+        if file_fingerprint(self.url) != fingerprint:
+            return
+        with self._condition:
+            if self._file_fingerprint == fingerprint:
+                self._page_fingerprints = page_fingerprints
+
+    def _reload(self):
+        document, fingerprint = self._open_stable_document()
+        if document is None:
+            print("Failed to reload PDF file: " + self.url)
+            return
+
+        if fingerprint == self._file_fingerprint:
+            document.close()
+            return
+
+        page_fingerprints = self._get_page_fingerprints(document)
+        with self._condition:
+            changed_pages = get_changed_pages(self._page_fingerprints, page_fingerprints)
+            self._file_fingerprint = fingerprint
+            self._page_fingerprints = page_fingerprints
+
+        self.callback(document, fingerprint, changed_pages)
+
+    def _open_stable_document(self):
+        '''Return document and file fingerprint after file is written completely, (None, None) if timeout.'''
+        start_time = time.time()
+        last_stat = None
+        stable_time = None    # time when size and mtime stop changing
+        while self._running and time.time() - start_time < self.timeout:
+            time.sleep(self.stable_delay)
+            try:
+                stat = os.stat(self.url)
+                stat = (stat.st_size, stat.st_mtime_ns)
+                if stat != last_stat:
+                    # File is still being written.
+                    last_stat = stat
+                    stable_time = time.time()
+                    continue
+
+                document = fitz.open(self.url)
+                stat_after_open = os.stat(self.url)
+                if ((stat_after_open.st_size, stat_after_open.st_mtime_ns) == stat and
+                    self._is_complete_document(document, time.time() - stable_time)):
+                    return document, file_fingerprint(self.url)
+                document.close()
+            except Exception:
+                pass
+        return None, None
+
+    def _is_complete_document(self, document, stable_duration):
+        if document.page_count == 0:
+            return False
+
+        # Load last page, make sure page tree is readable.
+        document[document.page_count - 1]
+        if not document.is_pdf:
+            return True
+
+        # Half written file looks broken, but some complete PDF files need repair too,
+        # or have bytes after %%EOF, accept them when they stay unchanged.
+        if stable_duration >= self.repair_delay:
+            return True
+
+        # MuPDF repairs broken xref of half written file.
+        if getattr(document, "is_repaired", False):
+            return False
+
+        with open(self.url, "rb") as f:
+            head = f.read(5)
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 1024))
+            tail = f.read()
+        return head == b"%PDF-" and b"%%EOF" in tail
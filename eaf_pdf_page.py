@@ -21,11 +21,11 @@
 
 import fitz
 fitz.TOOLS.unset_quad_corrections(True)
-from core.utils import get_emacs_vars
-from eaf_pdf_utils import generate_random_key, support_hit_max
-from PyQt6.QtCore import QRect, QRectF
-from PyQt6.QtGui import QColor, QCursor, QImage, QPainter, QPixmap
-from PyQt6.QtWidgets import QToolTip
+import numpy as np
+from eaf_pdf_text import PdfCharTable
+from eaf_pdf_utils import RectIndex, generate_random_key
+from PyQt6 import sip
+from PyQt6.QtGui import QImage
 
 
 def set_page_crop_box(page):
@@ -34,12 +34,6 @@ def set_page_crop_box(page):
     else:
         return page.setCropBox
 
-def get_page_text(page):
-    if hasattr(page, "get_text"):
-        return page.get_text
-    else:
-        return page.getText
-
 def set_page_rotation(page):
     if hasattr(page, "set_rotation"):
         return page.set_rotation
@@ -52,6 +46,18 @@ def get_page_pixmap(page):
     else:
         return page.getPixmap
 
+def get_page_textpage(page):
+    if hasattr(page, "get_textpage"):
+        return page.get_textpage
+    else:
+        return page.getTextPage
+
+def get_page_fonts(page):
+    if hasattr(page, "get_fonts"):
+        return page.get_fonts
+    else:
+        return page.getFontList
+
 def pixmap_invert_irect(pixmap):
     if hasattr(pixmap, "invert_irect"):
         return pixmap.invert_irect
@@ -70,6 +76,82 @@ def get_page_image_bbox(page):
     else:
         return page.getImageBbox
 
+def fitz_pixmap_to_qimage(pixmap):
+    '''
+    Wrap samples of fitz.Pixmap in QImage without copy, keep pixmap alive while QImage is used.
+    '''
+    image_format = QImage.Format.Format_RGBA8888 if pixmap.alpha else QImage.Format.Format_RGB888
+    if hasattr(pixmap, "samples_ptr"):
+        return QImage(sip.voidptr(pixmap.samples_ptr), pixmap.width, pixmap.height, pixmap.stride, image_format)
+    else:
+        return QImage(pixmap.samples, pixmap.width, pixmap.height, pixmap.stride, image_format)
+
+def page_rect_to_cropbox(page, rect):
+    '''
+    Convert rect of page coordinate (text or pixmap of rotated page, origin is its top left corner)
+    to cropbox coordinate, clip of PdfPage use it.
+    '''
+    cropbox = page.cropbox
+    return fitz.Rect(rect) * page.derotation_matrix * fitz.Matrix(1, 0, 0, 1, cropbox.x0, cropbox.y0)
+
+def get_page_text_rect(page):
+    '''Return rect that contains text blocks of fitz page inside its cropbox, None if page has no text.'''
+    xx0 = yy0 = xx1 = yy1 = None
+    # Text blocks is enough, don't need build char level rawdict.
+    for block in get_page_textpage(page)().extractBLOCKS():
+        # ignore image bbox
+        if block[6] != 0:
+            continue
+
+        x0, y0, x1, y1 = block[:4]
+        if xx0 is None:
+            xx0, yy0, xx1, yy1 = x0, y0, x1, y1
+        else:
+            xx0, yy0, xx1, yy1 = min(xx0, x0), min(yy0, y0), max(xx1, x1), max(yy1, y1)
+
+    if xx0 is None:
+        return None
+    rect = page_rect_to_cropbox(page, (xx0, yy0, xx1, yy1)) & page.cropbox
+    return None if rect.is_empty else rect
+
+def get_page_raster_rect(page, size=256, threshold=160, noise=0.01):
+    '''
+    Return rect of content in fitz page found from grayscale thumbnail (in cropbox coordinate), None if page is blank.
+    It's used by page that has no text layer, such as scanned page.
+
+    Thumbnail is scaled to size pixels of long side, pixel darker than threshold is content.
+    Isolated dark pixels, rows or columns that have fewer than noise of content pixels are speckle,
+    rows or columns that are almost all dark are scan shadow of page border, they are ignored.
+    '''
+    rect = page.rect
+    zoom = size / max(rect.width, rect.height, 1)
+    pixmap = get_page_pixmap(page)(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    width, height = pixmap.width, pixmap.height
+    if width < 3 or height < 3:
+        return None
+
+    gray = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(height, pixmap.stride)[:, :width]
+    dark = gray < threshold
+
+    # Count dark pixels in 3x3 neighbourhood, drop pixel that has no dark neighbour.
+    padded = np.pad(dark, 1).astype(np.uint8)
+    neighbours = sum(padded[dy:dy + height, dx:dx + width] for dy in range(3) for dx in range(3))
+    dark &= neighbours > 1
+
+    # Clear border shadow first, it shouldn't be counted in content of crossing rows or columns.
+    dark[dark.sum(axis=1) >= 0.9 * width, :] = False
+    dark[:, dark.sum(axis=0) >= 0.9 * height] = False
+
+    rows = np.flatnonzero(dark.sum(axis=1) >= max(2, noise * width))
+    columns = np.flatnonzero(dark.sum(axis=0) >= max(2, noise * height))
+    if rows.size == 0 or columns.size == 0:
+        return None
+
+    # Grow one pixel, thumbnail pixel covers 1 / zoom points.
+    content_rect = page_rect_to_cropbox(page, ((columns[0] - 1) / zoom, (rows[0] - 1) / zoom,
+                                               (columns[-1] + 2) / zoom, (rows[-1] + 2) / zoom)) & page.cropbox
+    return None if content_rect.is_empty else content_rect
+
 class PdfPage(fitz.Page):
     def __init__(self, page, page_index, is_pdf, clip=None):
         self.page = page
@@ -77,117 +159,103 @@ class PdfPage(fitz.Page):
         self.is_pdf = is_pdf
         self.clip = clip or page.cropbox
 
-        self._mark_link_annot_list = []
-        self._mark_search_annot_list = []
-        self._mark_jump_annot_list = []
         self._links = None
         self._annots = None
 
-        self._page_rawdict = self._init_page_rawdict()
-        # self._page_char_rect_list = self._init_page_char_rect_list()
-        self._tight_margin_rect = self._init_tight_margin()
-        
-        self.hierarchy = ["", "blocks", "lines", "spans", "chars"]
-        
+        # Must set CropBox before get page text, if no,
+        # the rawdict bbox coordinate is wrong
+        # cause the select text failed
+        self.set_clip_cropbox()
+
+        # Text layer is built when first used, rendering page don't need it.
+        self._textpage = None
+        self._char_table = None
+        self._words = None
+        # Spatial indexes of words, links and annots for hit test, built when first used.
+        self._hit_indexes = {}
+
         self.hovered_annot = None
 
     def __getattr__(self, attr):
         return getattr(self.page, attr)
 
-    def _init_page_rawdict(self):
-        if self.is_pdf:
-            try:
-                # Must set CropBox before get page rawdict , if no,
-                # the rawdict bbox coordinate is wrong
-                # cause the select text failed
-                set_page_crop_box(self.page)(self.clip)
-                d = get_page_text(self.page)("rawdict", flags=fitz.TEXT_ACCURATE_BBOXES)
-                return d
-            except:
-                return get_page_text(self.page)("rawdict", flags=fitz.TEXT_ACCURATE_BBOXES)
-        else:
-            return get_page_text(self.page)("rawdict", flags=fitz.TEXT_ACCURATE_BBOXES)
-
-    def _init_page_char_rect_list(self):
-        '''Collection page char rect list when page init'''
-        lines_list = []
-        spans_list = []
-        chars_list = []
-
-        for block in self._page_rawdict["blocks"]:
-            if "lines" in block:
-                lines_list += block["lines"]
-
-        for line in lines_list:
-            if "spans" in line:
-                spans_list += line["spans"]
-
-        for span in spans_list:
-            if "chars" in span:
-                chars_list += span["chars"]
-
-        return chars_list
-
-    def _init_tight_margin(self):
-        xx0, yy0, xx1, yy1 = self.page.cropbox
-        for block in self._page_rawdict["blocks"]:
-            # ignore image bbox
-            if block["type"] != 0:
-                continue
-
-            x0, y0, x1, y1 = block["bbox"]
-            if x0 < xx0:
-                xx0 = x0
-            if y0 < yy0:
-                yy0 = y0
-            if x1 > xx1:
-                xx1 = x1
-            if y1 > yy1:
-                yy1 = y1
-        return fitz.Rect(xx0, yy0, xx1, yy1)
-
-    def get_tight_margin_rect(self):
-        # if current page don't computer tight rect
-        # return None
-        if self._tight_margin_rect == self.page.mediabox:
-            return None
-        return self._tight_margin_rect
-
-    def get_page_char_rect_list(self):
-        return self._page_char_rect_list
-
-    def _get_intersect_block(self, rect):
-        '''Get intersect block by rect.'''
-        for i, block in enumerate(self._page_rawdict["blocks"]):
-            # ignore image bbox
-            if block["type"] != 0:
-                continue
-            
-            if self._is_intersects(block["bbox"], rect):
-                return i, block
-        return None, None
-
-    def _get_intersect_line(self, block, rect):
-        '''Get intersect line by rect.'''
-        for i, line in enumerate(block["lines"]):
-            if self._is_intersects(line["bbox"], rect):
-                return i, line
-        return None, None
-    
-    def _get_intersect_span(self, line, rect):
-        '''Get intersect span by rect.'''
-        for i, span in enumerate(line["spans"]):
-            if self._is_intersects(span["bbox"], rect):
-                return i, span
-        return None, None
-    
-    def _get_intersect_char(self, span, rect):
-        '''Get intersect char by rect.'''
-        for i, char in enumerate(span["chars"]):
-            if self._is_intersects(char["bbox"], rect):
-                return i, char
-        return None, None
-    
+    def has_text(self):
+        '''Page without font (such as scanned page) has no text, skip text extraction.'''
+        if not self.is_pdf:
+            return True
+
+        try:
+            return len(get_page_fonts(self.page)()) > 0
+        except Exception:
+            return True
+
+    def inherit_text_layer(self, page):
+        '''Take text layer of page that has same content, such as unchanged page of reloaded document.'''
+        self._char_table = page._char_table
+        self._words = page._words
+        self._links = page._links
+        # Annots are bound to their page object, rebuild annots index.
+        self._hit_indexes = {kind: hit_index for kind, hit_index in page._hit_indexes.items() if kind != "annots"}
+
+    def get_textpage(self):
+        if self._textpage is None:
+            self.set_clip_cropbox()
+            self._textpage = get_page_textpage(self.page)(flags=fitz.TEXT_ACCURATE_BBOXES)
+        return self._textpage
+
+    def release_textpage(self):
+        # TextPage holds all text of page, it's not needed after char table and words are extracted.
+        if self._char_table is not None and self._words is not None:
+            self._textpage = None
+
+    def get_char_table(self):
+        '''Return PdfCharTable of page, rawdict is only kept while building it.'''
+        if self._char_table is None:
+            if self.has_text():
+                self._char_table = PdfCharTable(self.get_textpage().extractRAWDICT())
+            else:
+                self._char_table = PdfCharTable({"blocks": []})
+            self.release_textpage()
+        return self._char_table
+
+    def get_words(self):
+        if self._words is None:
+            self._words = self.get_textpage().extractWORDS() if self.has_text() else []
+            self.release_textpage()
+        return self._words
+
+    def get_hit_index(self, kind):
+        '''Return RectIndex of kind (words, links or annots), build it when first used.'''
+        if kind not in self._hit_indexes:
+            if kind == "words":
+                hit_index = RectIndex(cell_size=20)
+                for word in self.get_words():
+                    hit_index.insert(word[:4], word)
+            elif kind == "links":
+                hit_index = RectIndex()
+                for link in self.get_links():
+                    hit_index.insert(link["from"], link)
+            else:
+                hit_index = RectIndex()
+                for annot in self.get_annots():
+                    hit_index.insert(annot.rect, annot)
+
+            self._hit_indexes[kind] = hit_index
+        return self._hit_indexes[kind]
+
+    def get_link_at_point(self, x, y):
+        links = self.get_hit_index("links").query_point(x, y)
+        return links[0] if links else None
+
+    def get_annot_at_point(self, x, y):
+        annots = self.get_hit_index("annots").query_point(x, y)
+        return annots[0] if annots else None
+
+    def get_word_at_rect(self, rect):
+        '''Return text of first word that intersect with rect.'''
+        words = self.get_hit_index("words").query(rect)
+        return words[0][4] if words else None
+
     def is_char_at_point(self, x, y):
         '''return if there is a char under the x and y coordinate.'''
         if x and y is None:
@@ -195,127 +263,51 @@ class PdfPage(fitz.Page):
 
         offset = 5
         rect = (x-1, y, x + offset, y + offset)
-        block_index, intersected_block = self._get_intersect_block(rect)
-        if intersected_block is None:
-            return None
-        line_index, intersected_line = self._get_intersect_line(intersected_block, rect)
-        if intersected_line is None:
-            return None
-        span_index, intersected_span = self._get_intersect_span(intersected_line, rect)
-        if intersected_span is None:
-            return None
-        char_index, intersected_char = self._get_intersect_char(intersected_span, rect)
-        if intersected_char is None:
+        # Index of char in char table, in page order.
+        return self.get_char_table().get_char_at_rect(rect)
+
+    def get_hover_rect(self, x, y):
+        '''
+        Return rect around point that hover result (char, link or annot) is unchanged in it,
+        or None if there is nothing under point.
+        '''
+        links = self.get_hit_index("links").query_point(x, y)
+        annots = self.get_hit_index("annots").query_point(x, y)
+        if links or annots:
+            rect = fitz.Rect(annots[0].rect if annots else links[0]["from"])
+        else:
+            index = self.is_char_at_point(x, y)
+            if index is None:
+                return None
+            bbox = self.get_char_table().get_bbox(index)
+            # Points that is_char_at_point hit this char.
+            rect = fitz.Rect(bbox[0] - 5, bbox[1] - 5, bbox[2] + 1, bbox[3])
+
+        # Other links or annots inside rect change hover result.
+        count = len(self.get_hit_index("links").query(rect)) + len(self.get_hit_index("annots").query(rect))
+        if count > (1 if links or annots else 0):
             return None
-        return block_index, line_index, span_index, char_index
-    
+        return rect
+
     def get_line_at_point(self, x, y):
         '''get the line under the x and y coordinate.'''
         index = self.is_char_at_point(x, y)
         if index is None:
             return None
-        block_index, line_index, span_index, char_index = index
-        intersected_block = self._page_rawdict["blocks"][block_index]
-        intersected_line = intersected_block["lines"][line_index]
-        line = []
-        for i, span in enumerate(intersected_line["spans"]):
-            for j, char in enumerate(span["chars"]):
-                line.append(char["c"])
-        return "".join(line)
-    
-    def get_page_char_rect_index(self, x, y):
-        '''According X and Y coordinate return index of char in char rect list.'''
-        if x and y is None:
-            return None
+        return self.get_char_table().get_line_text(index)
 
-        offset = 15
-        rect = fitz.Rect(x, y, x + offset, y + offset)
-        for char_index, char in enumerate(self._page_char_rect_list):
-            if fitz.Rect(char["bbox"]).intersects(rect):
-                return char_index
-        return None
-      
     def get_page_obj_rect_index(self, x, y):
-        '''According X and Y coordinate return index of char in raw_dict.'''
+        '''According X and Y coordinate return index of char in char table.'''
         return self.is_char_at_point(x, y)
        
     
-    def get_obj_from_range(self, start, end):
-        """
-        start and end are 4-tuple (block_index, line_index, span_index, char_index)
-        """
-        obj_list = []
-        self._get_obj_from_range(self._page_rawdict["blocks"], start, end, obj_list)
-        return obj_list
-     
-    
-    def _get_obj_from_range(self, structs, start, end, collections):      
-        """
-        pre-order traverse the page rawdict and get the objects in the range of start and end.
-        """    
-        remain_level = len(start) - 1
-        child_name = self.hierarchy[-remain_level]
-        
-        start_idx, end_idx = start[0], end[0]
-        
-        if end_idx == -1:
-            end_idx = len(structs) - 1
-            
-        if remain_level == 0:
-            # collect in the first block
-            collections.extend(structs[start_idx: end_idx + 1])
-            return
-            
-        if start_idx == end_idx:
-            # collect in the first block
-            if child_name in structs[start_idx]:
-                self._get_obj_from_range(structs[start_idx][child_name], start[1:], end[1:], collections)
-            return
-
-        if child_name in structs[start_idx]:
-            self._get_obj_from_range(structs[start_idx][child_name], start[1:], [-1]*remain_level, collections)
-        # collect in the middle blocks
-        for blk in range(start_idx + 1, end_idx):
-            collections.append(structs[blk])
-            
-        if child_name in structs[end_idx]:
-            self._get_obj_from_range(structs[end_idx][child_name], [0] * remain_level, end[1:], collections)
-    
-    def parse_obj_list(self, obj_list):
-        """
-        obj_list is a list of objects in the page rawdict.
-        """
-        def _parse_span(span):
-            res = []
-            for char in span["chars"]:
-                res.append(char["c"])
-            return "".join(res)
-        
-        def _parse_line(line):
-            res = []
-            for span in line["spans"]:
-                res.append(_parse_span(span))
-            return "\n" + "".join(res) + "\n"
-        
-        def _parse_block(block):
-            res = []
-            for line in block["lines"]:
-                res.append(_parse_line(line))
-            return "".join(res)
-        
-        segments = []
-        for obj in obj_list:
-            if "c" in obj:
-                segments.append(obj["c"])
-            elif "chars" in obj:
-                segments.append(_parse_span(obj))
-            elif "spans" in obj:
-                segments.append(_parse_line(obj))
-            elif "lines" in obj:
-                segments.append(_parse_block(obj))
-    
-        return "".join(segments).replace("\n\n", "\n").strip("\n")
-        
+    def get_select_text(self, start, end):
+        '''Return text between char index start and end (included).'''
+        return self.get_char_table().get_text(start, end)
+
+    def get_select_rects(self, start, end):
+        '''Return line rects of chars between char index start and end (included).'''
+        return self.get_char_table().get_line_rects(start, end)
 
     def set_rotation(self, rotation):
         set_page_rotation(self.page)(rotation)
@@ -326,14 +318,37 @@ class PdfPage(fitz.Page):
             self.page_width = self.page.cropbox.width
             self.page_height = self.page.cropbox.height
 
-    def get_qpixmap(self, scale, invert, invert_image=False):
+    def get_display_list(self):
+        '''
+        Return fitz.DisplayList of page with current clip and rotation.
+        Replay it to render other scales or tiles without interpret page content again.
+        '''
+        self.set_clip_cropbox()
+        return self.page.get_displaylist()
+
+    def set_clip_cropbox(self):
         if self.is_pdf:
             try:
                 set_page_crop_box(self.page)(self.clip)
             except:
                 pass
 
-        pixmap = get_page_pixmap(self.page)(matrix=fitz.Matrix(scale, scale), alpha=True)
+    def get_fitz_pixmap(self, scale, invert, invert_image=False, tile_clip=None, image_rects=None, alpha=True,
+                        display_list=None):
+        '''
+        Rasterize page to fitz.Pixmap, RGBA if alpha is True, otherwise RGB with white background.
+
+        tile_clip is a rect of page coordinate, only render this area of page if it's not None.
+        image_rects is cached result of get_image_rects, it's computed if None.
+        display_list is result of get_display_list, render from it if it's not None.
+        Invert render need transparent background, alpha is ignored when invert.
+        '''
+        self.set_clip_cropbox()
+
+        if display_list is not None:
+            pixmap = display_list.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=alpha or invert, clip=tile_clip)
+        else:
+            pixmap = get_page_pixmap(self.page)(matrix=fitz.Matrix(scale, scale), alpha=alpha or invert, clip=tile_clip)
 
         if invert:
             # make background transparent
@@ -346,45 +361,7 @@ class PdfPage(fitz.Page):
             pixmap_invert_irect(pixmap)(pixmap.irect)
 
         if not invert_image and invert:
-            pixmap = self.with_invert_exclude_image(scale, pixmap)
-
-        img = QImage(pixmap.samples, pixmap.width, pixmap.height, pixmap.stride, QImage.Format.Format_RGBA8888)
-        qpixmap = QPixmap.fromImage(img)
-
-        if self.get_annots():
-            qpixmap = self.draw_annots(qpixmap, scale)
-
-        return qpixmap
-
-    def draw_annots(self, pixmap, scale):
-        if self.hovered_annot is None:
-            return pixmap
-
-        qp = QPainter(pixmap)
-        qp.setRenderHint(QPainter.RenderHint.Antialiasing)
-        qp.setCompositionMode(QPainter.CompositionMode.CompositionMode_DestinationAtop)
-        annot = self.hovered_annot
-
-        r, g, b = getattr(annot.colors, "stroke", (1.0, 0.84, 0.08))
-        color = QColor(int(r) * 255, int(g) * 255, int(b) * 255, 153)
-
-        vertices = annot.vertices
-        if vertices is not None and len(vertices) % 4 == 0:
-            for i in range(0, len(vertices), 4):
-                # top-left and bottom-right point
-                rect = fitz.Rect(vertices[i], vertices[i+3]) * scale
-                qrect = QRectF(rect.x0, rect.y0, rect.width, rect.height)
-                qp.fillRect(qrect, color)
-        else:
-            rect = annot.rect
-            qrect = QRectF(rect.x0, rect.y0, rect.width, rect.height)
-            qp.fillRect(qrect, color)
-
-        if annot and annot.info["content"]:
-            QToolTip.showText(QCursor.pos(), annot.info["content"], None, QRect(), 10 * 1000)
-        else:
-            if QToolTip.isVisible():
-                QToolTip.hideText()
+            pixmap = self.with_invert_exclude_image(scale, pixmap, image_rects)
 
         return pixmap
 
@@ -392,11 +369,10 @@ class PdfPage(fitz.Page):
         if not self.get_annots():
             return None, False
 
-        for annot in self.get_annots():
-            x0, y0, x1, y1 = annot.rect
-            if ex >= x0 and ex <= x1 and ey >= y0 and ey <= y1:
-                self.hovered_annot = annot
-                return annot, True
+        annot = self.get_annot_at_point(ex, ey)
+        if annot is not None:
+            self.hovered_annot = annot
+            return annot, True
 
         if self.hovered_annot is not None:
             self.hovered_annot = None
@@ -410,12 +386,24 @@ class PdfPage(fitz.Page):
         pixmap.set_alpha(alpha, 1, opaque=opaque_color)
         return pixmap
 
-    def with_invert_exclude_image(self, scale, pixmap):
+    def with_invert_exclude_image(self, scale, pixmap, image_rects=None):
         # steps:
         # First, make page all content is invert, include image and text.
         # if exclude image is True, will find the page all image, then get
         # each image rect. Finally, again invert all image rect.
+        if image_rects is None:
+            image_rects = self.get_image_rects()
+
+        for rect in image_rects:
+            pixmap_invert_irect(pixmap)(fitz.Rect(rect) * self.page.rotation_matrix * scale)
 
+        return pixmap
+
+    def get_image_rects(self):
+        '''
+        Return rects of images that should be inverted again in dark mode.
+        Result only depends on page content, cache it to avoid scan images every render.
+        '''
         self.page.clean_contents()
         # exclude image only support PDF document
         imagelist = None
@@ -425,14 +413,21 @@ class PdfPage(fitz.Page):
             # PyMupdf 1.14 not include argument 'full'.
             imagelist = get_page_image_list(self.page)
 
-        page_words = self.page.get_text_words()
+        if not imagelist:
+            return []
+
+        # Index words, image intersect check don't need to scan all words.
+        word_index = RectIndex()
+        for word in self.page.get_text_words():
+            word_index.insert(word[:4])
 
         image_rects = []
         for image in imagelist:
             try:
                 imagerect, _ = get_page_image_bbox(self.page)(image, True)
                 # Don't invert image if it is infinite, empty or intersect with words.
-                if imagerect.is_infinite or imagerect.is_empty or self.image_intersect_with_words(imagerect, page_words):
+                # If a image intersect with page words, there is a high probability that this picture is a watermark.
+                if imagerect.is_infinite or imagerect.is_empty or word_index.intersects(imagerect):
                     continue
 
                 intersects = []
@@ -449,83 +444,27 @@ class PdfPage(fitz.Page):
                 import traceback
                 traceback.print_exc()
 
-        for rect in image_rects:
-            pixmap_invert_irect(pixmap)(rect * self.page.rotation_matrix * scale)
+        return [tuple(rect) for rect in image_rects]
 
-        return pixmap
+    def get_overlay_matrix(self, scale):
+        '''Matrix that map page coordinate to pixel of rendered page, include rotation.'''
+        return self.page.rotation_matrix * fitz.Matrix(scale, scale)
 
-    def image_intersect_with_words(self, imagerect, page_words):
-        "If a image intersect with page words, there is a high probability that this picture is a watermark."
-        for page_word in page_words:
-            if fitz.Rect(page_word[:4]).intersects(imagerect):
-                return True
-
-        return False
-
-    def add_mark_link(self):
-        if self.page.first_link:
-            for link in self.page.get_links():
-                annot = self.page.add_underline_annot(link["from"])
-                annot.parent = self.page # Must assign annot parent, else delete_annot cause parent is None problem.
-                self._mark_link_annot_list.append(annot)
-
-    def cleanup_mark_link(self):
-        if self._mark_link_annot_list:
-            for annot in self._mark_link_annot_list:
-                self.page.delete_annot(annot)
-            self._mark_link_annot_list = []
-            
-    def mark_search_text(self, keyword, current_quad):
-        if not self.is_pdf:
-            # add_highlight_annot is only for pdf
-            return []
-        
-        if support_hit_max:
-            quads_list = self.page.searchFor(keyword, hit_max=999, quads=True)
-        else:
-            quads_list = self.page.search_for(keyword, quads=True)
-
-        if quads_list:
-            for quad in quads_list:
-                annot = self.page.add_highlight_annot(quad)
-                annot.parent = self.page
-                if quad == current_quad:
-                    qcolor = QColor("#f28100")
-                    annot.set_colors(stroke=qcolor.getRgbF()[0:3])
-                    annot.update()
-                self._mark_search_annot_list.append(annot)
-            return self._mark_search_annot_list
-        return []
-
-    def cleanup_search_text(self, old_annots):
-        annots = set(self._mark_search_annot_list) | set(old_annots)
-        for annot in annots:
-            self.page.delete_annot(annot)
-        self._mark_search_annot_list.clear()
-        self._annots = None
+    def get_link_rects(self):
+        return [link["from"] for link in self.get_links()]
 
-    def mark_jump_link_tips(self, letters):
-        fontsize, = get_emacs_vars(["eaf-pdf-marker-fontsize"])
-        cache_dict = {}
-        if self.page.first_link:
-            links = self.page.get_links()
+    def get_jump_link_tips(self, letters, fontsize):
+        '''Return list of (key, tip rect, link), tip rect is page coordinate.'''
+        tips = []
+        links = self.get_links()
+        if links:
             key_list = generate_random_key(len(links), letters)
             for index, link in enumerate(links):
                 key = key_list[index]
                 link_rect = link["from"]
-                annot_rect = fitz.Rect(link_rect.top_left, link_rect.x0 + fontsize/1.2 * len(key), link_rect.y0 + fontsize)
-                annot = self.page.add_freetext_annot(annot_rect, str(key), fontsize=fontsize, fontname="Helv", \
-                                                     text_color=[0.0, 0.0, 0.0], fill_color=[255/255.0, 197/255.0, 36/255.0], \
-                                                     align = 1)
-                annot.parent = self.page
-                self._mark_jump_annot_list.append(annot)
-                cache_dict[key] = link
-        return cache_dict
-
-    def cleanup_jump_link_tips(self):
-        for annot in self._mark_jump_annot_list:
-            self.page.delete_annot(annot)
-        self._mark_jump_annot_list = []
+                tip_rect = fitz.Rect(link_rect.top_left, link_rect.x0 + fontsize/1.2 * len(key), link_rect.y0 + fontsize)
+                tips.append((key, tip_rect, link))
+        return tips
 
     def get_links(self):
         if self._links is None:
@@ -536,18 +475,3 @@ class PdfPage(fitz.Page):
         if self._annots is None:
             self._annots = list(self.page.annots())
         return self._annots
-    
-    def _is_intersects(self, rect1, rect2):
-        x0, y0, x1, y1 = rect1
-        xx0, yy0, xx1, yy1 = rect2
-
-        # Check if there is NO overlap in the x-dimension
-        if x1 <= xx0 or x0 >= xx1:
-            return False
-
-        # Check if there is NO overlap in the y-dimension
-        if y1 <= yy0 or y0 >= yy1:
-            return False
-
-        # If there is overlap in both x and y dimensions, then the rectangles intersect
-        return True
\ No newline at end of file
@@ -0,0 +1,559 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2018 Andy Stewart
+#
+# Author:     Andy Stewart <lazycat.manatee@gmail.com>
+# Maintainer: Andy Stewart <lazycat.manatee@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import copy
+import functools
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import fitz
+from eaf_pdf_cache import PdfLruCache, file_fingerprint
+from eaf_pdf_page import PdfPage, fitz_pixmap_to_qimage
+
+
+# Display lists hold parsed content and images of page, keep a few pages only.
+DISPLAY_LIST_CACHE_COUNT = 8
+
+
+class PdfFileChangedError(Exception):
+    '''File is written again after the version to render is validated.'''
+
+
+class RenderTask():
+    def __init__(self, page_index, scale, rotation, invert, invert_image, clip=None, generation=0, tile_clip=None,
+                 aa_level=None, alpha=True, fingerprint=None):
+        self.page_index = page_index
+        self.scale = scale
+        self.rotation = rotation
+        self.invert = invert
+        self.invert_image = invert_image
+        self.clip = clip
+        self.generation = generation
+        self.tile_clip = tile_clip
+        # Anti-aliasing level (0-8) for draft render, None use default level.
+        self.aa_level = aa_level
+        # Render without alpha channel when page background is white.
+        self.alpha = alpha
+        # Fingerprint of document version when requested, raster in disk cache is loaded only if it's still current.
+        self.fingerprint = fingerprint
+        # Rects of images that excluded from invert, computed when render if None.
+        self.image_rects = None
+        # Rendered fitz pixmap, image wraps its samples, keep it until image is consumed.
+        self.fitz_pixmap = None
+        # Requested task of smaller priority renders first, it's distance from window center.
+        self.priority = 0
+        # Cache key of task, set when worker takes task.
+        self.key = None
+
+    def is_whole_page(self):
+        return self.tile_clip is None and self.aa_level is None
+
+    def need_image_rects(self):
+        return self.invert and not self.invert_image
+
+    def get_display_list_key(self):
+        '''Display list depends on page rotation and clip, scale and tile are applied when replay.'''
+        return (self.page_index, self.rotation, tuple(self.clip) if self.clip is not None else None)
+
+    def get_meta_key(self):
+        '''Key of page meta cache, page content rects depends on page clip.'''
+        if self.clip is None:
+            return (self.page_index, )
+        return (self.page_index, ) + tuple(round(value, 2) for value in self.clip)
+
+    def for_process(self):
+        '''Return copy of task that only contains plain values, it can be pickled to render process.'''
+        task = copy.copy(self)
+        task.fitz_pixmap = None
+        task.clip = tuple(self.clip) if self.clip is not None else None
+        task.tile_clip = tuple(self.tile_clip) if self.tile_clip is not None else None
+        return task
+
+    def render(self, document, display_lists=None):
+        '''Return QImage that wraps samples of rendered pixmap, it's valid until task is released.'''
+        self.fitz_pixmap = self.render_pixmap(document, display_lists)
+        return fitz_pixmap_to_qimage(self.fitz_pixmap)
+
+    def render_pixmap(self, document, display_lists=None):
+        '''display_lists is PdfLruCache of display lists of document, replay cached display list if it's not None.'''
+        clip = fitz.Rect(self.clip) if self.clip is not None else None
+        tile_clip = fitz.Rect(self.tile_clip) if self.tile_clip is not None else None
+
+        page = PdfPage(document[self.page_index], self.page_index, document.is_pdf, clip)
+        if document.is_pdf:
+            page.set_rotation(self.rotation)
+
+        if self.need_image_rects() and self.image_rects is None:
+            self.image_rects = page.get_image_rects()
+
+        display_list = None
+        if display_lists is not None:
+            display_list = display_lists.get(self.get_display_list_key())
+            if display_list is None:
+                display_list = page.get_display_list()
+                display_lists.put(self.get_display_list_key(), display_list)
+
+        if self.aa_level is None:
+            return page.get_fitz_pixmap(self.scale, self.invert, self.invert_image, tile_clip, self.image_rects, self.alpha,
+                                        display_list)
+
+        # Anti-aliasing level is global setting of fitz, restore it after render.
+        default_aa_level = fitz.TOOLS.show_aa_level()["graphics"]
+        fitz.TOOLS.set_aa_level(self.aa_level)
+        try:
+            return page.get_fitz_pixmap(self.scale, self.invert, self.invert_image, tile_clip, self.image_rects, self.alpha,
+                                        display_list)
+        finally:
+            fitz.TOOLS.set_aa_level(default_aa_level)
+
+
+class PdfRenderWorker():
+    '''
+    Render page images in background thread.
+
+    fitz is not thread-safe, so worker open its own document handle,
+    and never touch the document that GUI thread use.
+    callback(key, task, image) is called in worker thread,
+    call release(task) after image is consumed.
+
+    Requested task nearest to window center renders first, the same key isn't requested again
+    while it's rendering, until release(task) is called.
+    Idle tasks (prefetch) are rendered only when there is no requested task.
+    Page metadata computed when render (image rects) is saved in meta_cache if it's not None.
+    Whole page saved in disk_cache is loaded instead of render, image decode don't block GUI thread.
+
+    After reload(fingerprint), worker only renders file of fingerprint (version validated by reloader),
+    tasks wait if file is being written again.
+    '''
+    def __init__(self, url, callback, meta_cache=None, disk_cache=None):
+        self.url = url
+        self.callback = callback
+        self.meta_cache = meta_cache
+        self.disk_cache = disk_cache
+
+        # Display lists of recently rendered pages, zoom and tiles replay them.
+        self.display_lists = PdfLruCache(DISPLAY_LIST_CACHE_COUNT)
+
+        # Average seconds to render a whole page, None before first render.
+        self.render_time = None
+
+        self._document = None
+        self._document_version = None
+        self._version = 0    # increased when reloaded
+        self._fingerprint = None    # fingerprint of file version to render, None if unknown
+        self._running = True
+        self._tasks = {}    # key -> task, task of smallest priority render first
+        self._idle_tasks = {}    # key -> task, first requested task render first
+        self._rendering = {}    # key -> task that is rendering or its image isn't consumed
+        self._condition = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def request(self, key, task, priority=0):
+        with self._condition:
+            # Paint before result arrives request the page again.
+            if self._is_rendering(key, task):
+                return
+
+            # Move key to the end, newest request first if priorities are same.
+            task.priority = priority
+            self._tasks.pop(key, None)
+            self._idle_tasks.pop(key, None)
+            self._tasks[key] = task
+            self._condition.notify()
+
+    def prefetch(self, tasks):
+        '''Replace idle tasks with tasks, a dict of key -> task.'''
+        with self._condition:
+            self._idle_tasks = {key: task for key, task in tasks.items()
+                                if key not in self._tasks and not self._is_rendering(key, task)}
+            self._condition.notify()
+
+    def retain(self, keys):
+        '''Cancel pending tasks that not in keys.'''
+        with self._condition:
+            for key in list(self._tasks.keys()):
+                if key not in keys:
+                    self._tasks.pop(key)
+
+    def cancel(self):
+        with self._condition:
+            self._tasks.clear()
+            self._idle_tasks.clear()
+
+    def reload(self, fingerprint=None):
+        '''
+        Reopen document before next render, call it after file saved or changed.
+        fingerprint is file fingerprint of version to render, None if any version.
+        '''
+        with self._condition:
+            self._tasks.clear()
+            self._idle_tasks.clear()
+            self._version += 1
+            self._fingerprint = fingerprint
+
+    def release(self, task):
+        '''Release pixel buffer of task, call it after image of callback is copied.'''
+        task.fitz_pixmap = None
+        self._finish_task(task)
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._tasks.clear()
+            self._idle_tasks.clear()
+            self._condition.notify()
+
+    def _is_rendering(self, key, task):
+        '''Must be called with condition locked, task of other generation (page invalidated) renders again.'''
+        rendering_task = self._rendering.get(key)
+        return rendering_task is not None and rendering_task.generation == task.generation
+
+    def _finish_task(self, task):
+        '''Task is released or failed, its key can be requested again.'''
+        with self._condition:
+            if task.key is not None and self._rendering.get(task.key) is task:
+                self._rendering.pop(task.key)
+
+    def _take_task(self):
+        '''Pop next task and mark it rendering, must be called with condition locked.'''
+        if self._tasks:
+            key = min(reversed(self._tasks), key=lambda key: self._tasks[key].priority)
+            task = self._tasks.pop(key)
+        else:
+            key = next(iter(self._idle_tasks))
+            task = self._idle_tasks.pop(key)
+
+        task.key = key
+        self._rendering[key] = task
+        return key, task
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._tasks and not self._idle_tasks:
+                    self._condition.wait()
+
+                if not self._running:
+                    break
+
+                key, task = self._take_task()
+                version = self._version
+                fingerprint = self._fingerprint
+
+            try:
+                if self._document is None or self._document_version != version:
+                    document = fitz.open(self.url)
+                    if not self._is_file_version(fingerprint):
+                        document.close()
+                        self._retry_task(key, task, version)
+                        continue
+
+                    # Keep old document if open failed, it's reopened for next task.
+                    self._document = document
+                    self._document_version = version
+                    self.display_lists.clear()
+
+                image = self._load_disk_image(key, task)
+                if image is None:
+                    need_save_meta = self._load_page_meta(task)
+                    start_time = time.time()
+                    image = task.render(self._document, self.display_lists)
+                    if task.is_whole_page():
+                        self._update_render_time(time.time() - start_time)
+                    if need_save_meta:
+                        self._save_page_meta(task)
+                    self._save_disk_image(key, task, image)
+            except Exception:
+                traceback.print_exc()
+                self._finish_task(task)
+                continue
+
+            self.callback(key, task, image)
+
+    def _is_file_version(self, fingerprint):
+        '''Return True if file is still the version of fingerprint, False if it's being written again.'''
+        try:
+            return fingerprint is None or file_fingerprint(self.url) == fingerprint
+        except OSError:
+            return False
+
+    def _retry_task(self, key, task, version, delay=0.2):
+        '''Put task back when file is being written, reloader validates new version and reload worker.'''
+        with self._condition:
+            self._finish_task(task)
+            # Tasks of old version are dropped by reload.
+            if version == self._version and key not in self._tasks and key not in self._idle_tasks:
+                self._tasks[key] = task
+                self._condition.notify()
+            if delay > 0:
+                self._condition.wait(delay)
+
+    def _load_disk_image(self, key, task):
+        '''Return QImage of task saved in disk cache, or None if it need render.'''
+        if self.disk_cache is None or not task.is_whole_page():
+            return None
+        return self.disk_cache.load(key, task.fingerprint)
+
+    def _save_disk_image(self, key, task, image):
+        '''Save copy of whole page in disk cache, copy it here instead of GUI thread, image buffer is released after.'''
+        if self.disk_cache is not None and task.is_whole_page() and key not in self.disk_cache:
+            self.disk_cache.save(key, image.copy(), task.fingerprint)
+
+    def _load_page_meta(self, task):
+        '''Fill task with cached page metadata, return True if metadata will be computed by render.'''
+        if self.meta_cache is None or not task.need_image_rects():
+            return False
+
+        # Metadata of other document version is dropped, task renders the document of its fingerprint.
+        image_rects = self.meta_cache.get(task.get_meta_key(), "image_rects", task.fingerprint)
+        if image_rects is None:
+            return True
+
+        task.image_rects = [tuple(rect) for rect in image_rects]
+        return False
+
+    def _save_page_meta(self, task):
+        if task.image_rects is not None:
+            self.meta_cache.put(task.get_meta_key(), "image_rects", [list(rect) for rect in task.image_rects],
+                                task.fingerprint)
+
+    def _update_render_time(self, duration):
+        if self.render_time is None:
+            self.render_time = duration
+        else:
+            self.render_time = self.render_time * 0.8 + duration * 0.2
+
+
+# Document opened by render process, reopen it when version changed.
+_process_document = None
+_process_document_version = None
+_process_display_lists = None
+
+def render_in_process(url, version, fingerprint, task):
+    '''
+    Render page in render process, pixels are returned through shared memory to avoid pickling copy.
+    Return shared memory name, width, height, stride, alpha, render duration and image rects of page.
+    Raise PdfFileChangedError if file isn't the version of fingerprint.
+    '''
+    global _process_document, _process_document_version, _process_display_lists
+
+    if _process_document is None or _process_document_version != version:
+        document = fitz.open(url)
+        if fingerprint is not None and file_fingerprint(url) != fingerprint:
+            document.close()
+            raise PdfFileChangedError(url)
+
+        _process_document = document
+        _process_document_version = version
+        _process_display_lists = PdfLruCache(DISPLAY_LIST_CACHE_COUNT)
+
+    start_time = time.time()
+    pixmap = task.render_pixmap(_process_document, _process_display_lists)
+    samples = pixmap.samples_mv if hasattr(pixmap, "samples_mv") else pixmap.samples
+    size = len(samples)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    shm.buf[:size] = samples
+    shm.close()
+
+    return (shm.name, pixmap.width, pixmap.height, pixmap.stride, pixmap.alpha,
+            time.time() - start_time, task.image_rects)
+
+
+class PdfRenderProcessPool(PdfRenderWorker):
+    '''
+    Render page images in process pool, each process open the document itself.
+
+    Threads can't render pages in parallel because of GIL,
+    processes make prefetch scale with core count.
+    '''
+    def __init__(self, url, callback, process_count, meta_cache=None, disk_cache=None):
+        self.process_count = process_count
+        self._in_flight = 0
+        # Version that file is checked to be the fingerprint before submit.
+        self._checked_version = None
+        # Spawn processes, fork is unsafe in Qt application.
+        self._executor = ProcessPoolExecutor(max_workers=process_count, mp_context=get_context("spawn"))
+
+        PdfRenderWorker.__init__(self, url, callback, meta_cache, disk_cache)
+
+    def release(self, task):
+        PdfRenderWorker.release(self, task)
+
+        shm = getattr(task, "shared_memory", None)
+        if shm is None:
+            return
+
+        task.shared_memory = None
+        try:
+            shm.close()
+        except BufferError:
+            # QImage still reference the buffer, memory will be unmapped when it's released.
+            pass
+        shm.unlink()
+
+    def stop(self):
+        PdfRenderWorker.stop(self)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and (self._in_flight >= self.process_count or
+                                         (not self._tasks and not self._idle_tasks)):
+                    self._condition.wait()
+
+                if not self._running:
+                    break
+
+                key, task = self._take_task()
+                version = self._version
+                fingerprint = self._fingerprint
+
+            # Don't submit tasks when file is being written again, render process checks it again after open.
+            if self._checked_version != version:
+                if not self._is_file_version(fingerprint):
+                    self._retry_task(key, task, version)
+                    continue
+                self._checked_version = version
+
+            # Decode raster of disk cache in this thread, it's faster than render in process.
+            image = self._load_disk_image(key, task)
+            if image is not None:
+                self.callback(key, task, image)
+                continue
+
+            need_save_meta = self._load_page_meta(task)
+            with self._condition:
+                # stop() shuts down executor after it clears _running under this lock.
+                if not self._running:
+                    self._finish_task(task)
+                    break
+
+                try:
+                    future = self._executor.submit(render_in_process, self.url, version, fingerprint, task.for_process())
+                except RuntimeError:
+                    # Executor is shut down or broken.
+                    traceback.print_exc()
+                    self._finish_task(task)
+                    break
+                self._in_flight += 1
+            future.add_done_callback(functools.partial(self._handle_render_done, key, task, version, need_save_meta))
+
+    def _handle_render_done(self, key, task, version, need_save_meta, future):
+        from PyQt6 import sip
+        from PyQt6.QtGui import QImage
+
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+        # Task is cancelled by stop().
+        if future.cancelled():
+            self._finish_task(task)
+            return
+
+        try:
+            name, width, height, stride, alpha, duration, image_rects = future.result()
+        except PdfFileChangedError:
+            # Check file before submit again, _run waits until file is stable.
+            self._checked_version = None
+            self._retry_task(key, task, version, 0)
+            return
+        except Exception:
+            traceback.print_exc()
+            self._finish_task(task)
+            return
+
+        if need_save_meta:
+            task.image_rects = image_rects
+            self._save_page_meta(task)
+
+        task.shared_memory = shared_memory.SharedMemory(name=name)
+        if task.is_whole_page():
+            self._update_render_time(duration)
+
+        # Wrap shared memory without copy, QPixmap.fromImage copy it in GUI thread.
+        image_format = QImage.Format.Format_RGBA8888 if alpha else QImage.Format.Format_RGB888
+        image = QImage(sip.voidptr(task.shared_memory.buf), width, height, stride, image_format)
+        self._save_disk_image(key, task, image)
+        self.callback(key, task, image)
+
+
+class PdfPrefetcher():
+    '''
+    Track scroll direction and velocity, decide which pages to render before they are visible.
+    '''
+    def __init__(self, max_count=8, time_budget=1.0):
+        self.max_count = max_count
+        # Seconds of rendering we can spend on prefetch ahead of user.
+        self.time_budget = time_budget
+
+        self.direction = 1
+        self.velocity = 0    # pages per second
+
+        self._last_offset = None
+        self._last_time = 0
+
+    def record_scroll(self, offset, page_height):
+        now = time.time()
+        if self._last_offset is not None and offset != self._last_offset:
+            self.direction = 1 if offset > self._last_offset else -1
+
+            duration = max(now - self._last_time, 0.001)
+            velocity = abs(offset - self._last_offset) / page_height / duration
+            if duration > 1:
+                # Start new scroll.
+                self.velocity = velocity
+            else:
+                self.velocity = self.velocity * 0.5 + velocity * 0.5
+
+        self._last_offset = offset
+        self._last_time = now
+
+    def is_fast_scrolling(self, threshold=2):
+        '''Return True if user is scrolling more than threshold pages per second.'''
+        return time.time() - self._last_time < 0.2 and self.velocity > threshold
+
+    def get_prefetch_count(self, render_time):
+        # Velocity is meaningless when user stop scrolling.
+        velocity = self.velocity if time.time() - self._last_time < 1 else 0
+
+        # Prefetch more pages when page render fast, or user scroll fast.
+        count = max(self.time_budget / max(render_time or self.time_budget, 0.001), velocity * self.time_budget)
+        return max(1, min(self.max_count, int(count)))
+
+    def get_prefetch_pages(self, start_index, last_index, page_count, render_time):
+        '''
+        Return page indexes to prefetch, pages ahead in scroll direction first, then one page behind.
+        last_index is the index after last visible page.
+        '''
+        count = self.get_prefetch_count(render_time)
+        if self.direction > 0:
+            pages = list(range(last_index, last_index + count)) + [start_index - 1]
+        else:
+            pages = list(range(start_index - 1, start_index - 1 - count, -1)) + [last_index]
+
+        return [index for index in pages if 0 <= index < page_count]
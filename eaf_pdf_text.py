@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2018 Andy Stewart
+#
+# Author:     Andy Stewart <lazycat.manatee@gmail.com>
+# Maintainer: Andy Stewart <lazycat.manatee@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+
+class PdfCharTable():
+    '''
+    Chars of page text layer stored as arrays, instead of rawdict that has a dict per char.
+
+    Chars are in text page order, char index is position in arrays.
+    Line of char is found by line offset array, chars of line i are line_starts[i]:line_starts[i + 1].
+    '''
+    def __init__(self, rawdict):
+        codes = []
+        bboxes = []
+        line_starts = [0]
+        for block in rawdict["blocks"]:
+            # ignore image bbox
+            if block["type"] != 0:
+                continue
+
+            for line in block.get("lines", []):
+                for span in line.get("spans", []):
+                    for char in span.get("chars", []):
+                        codes.append(ord(char["c"][0]) if char["c"] else 32)
+                        bboxes.extend(char["bbox"])
+
+                # skip empty line
+                if len(codes) > line_starts[-1]:
+                    line_starts.append(len(codes))
+
+        self.codes = np.array(codes, dtype=np.uint32)
+        self.bboxes = np.array(bboxes, dtype=np.float32).reshape(-1, 4)
+        self.line_starts = np.array(line_starts, dtype=np.int32)
+        self.char_lines = np.repeat(np.arange(len(line_starts) - 1, dtype=np.int32), np.diff(self.line_starts))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def get_char_at_rect(self, rect):
+        '''Return index of first char that intersect with rect, or None.'''
+        x0, y0, x1, y1 = rect[:4]
+        bboxes = self.bboxes
+        mask = (bboxes[:, 0] < x1) & (bboxes[:, 2] > x0) & (bboxes[:, 1] < y1) & (bboxes[:, 3] > y0)
+        indexes = np.flatnonzero(mask)
+        return int(indexes[0]) if indexes.size else None
+
+    def get_bbox(self, index):
+        return tuple(float(v) for v in self.bboxes[index])
+
+    def get_text(self, start, end):
+        '''Return text of chars from start to end (included), lines are separated by newline.'''
+        if start > end:
+            start, end = end, start
+
+        text = self.codes[start:end + 1].tobytes().decode("utf-32-le", errors="replace")
+        breaks = np.flatnonzero(np.diff(self.char_lines[start:end + 1])) + 1
+        bounds = [0] + breaks.tolist() + [len(text)]
+        return "\n".join(text[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1))
+
+    def get_line_text(self, index):
+        '''Return text of line that contains char index.'''
+        line = self.char_lines[index]
+        return self.get_text(int(self.line_starts[line]), int(self.line_starts[line + 1]) - 1)
+
+    def get_line_rects(self, start, end):
+        '''
+        Return rects (x0, y0, x1, y1) that cover chars from start to end (included),
+        lines on the same row are merged into one rect.
+        '''
+        if start > end:
+            start, end = end, start
+
+        bboxes = self.bboxes[start:end + 1]
+        if len(bboxes) == 0:
+            return []
+
+        # Bbox of every line in range.
+        offsets = np.concatenate(([0], np.flatnonzero(np.diff(self.char_lines[start:end + 1])) + 1))
+        lines = np.column_stack((np.minimum.reduceat(bboxes[:, 0], offsets),
+                                 np.minimum.reduceat(bboxes[:, 1], offsets),
+                                 np.maximum.reduceat(bboxes[:, 2], offsets),
+                                 np.maximum.reduceat(bboxes[:, 3], offsets))).tolist()
+
+        rects = []
+        rx0, ry0, rx1, ry1 = lines[0]
+        for (x0, y0, x1, y1) in lines[1:]:
+            if abs(y0 - ry0) < 3 or abs(y1 - ry1) < 3 or abs((y0 + y1) / 2 - (ry0 + ry1) / 2) < 3:
+                # The same row
+                rx0, ry0, rx1, ry1 = min(rx0, x0), min(ry0, y0), max(rx1, x1), max(ry1, y1)
+            else:
+                rects.append((rx0, ry0, rx1, ry1))
+                rx0, ry0, rx1, ry1 = x0, y0, x1, y1
+        rects.append((rx0, ry0, rx1, ry1))
+        return rects
@@ -62,3 +62,61 @@ import fitz
 
 support_hit_max = is_old_version(fitz.VersionBind)
 use_new_doc_name = is_doc_new_name(fitz.VersionBind)
+
+class RectIndex():
+    '''
+    Uniform grid spatial index of rects, find rects that intersect with given rect
+    without scan all rects.
+    '''
+    def __init__(self, cell_size=50):
+        self.cell_size = cell_size
+        self._items = []    # (rect, value)
+        self._cells = {}    # (column, row) -> item indexes
+
+    def __len__(self):
+        return len(self._items)
+
+    def _cell_range(self, rect):
+        x0, y0, x1, y1 = rect
+        size = self.cell_size
+        return (range(int(x0 // size), int(x1 // size) + 1),
+                range(int(y0 // size), int(y1 // size) + 1))
+
+    def insert(self, rect, value=None):
+        item_index = len(self._items)
+        self._items.append((tuple(rect[:4]), value))
+
+        columns, rows = self._cell_range(rect[:4])
+        for column in columns:
+            for row in rows:
+                self._cells.setdefault((column, row), []).append(item_index)
+
+    def query(self, rect):
+        '''Return values of rects that intersect with rect, in insert order.'''
+        x0, y0, x1, y1 = rect[:4]
+        item_indexes = set()
+        columns, rows = self._cell_range((x0, y0, x1, y1))
+        for column in columns:
+            for row in rows:
+                item_indexes.update(self._cells.get((column, row), ()))
+
+        values = []
+        for item_index in sorted(item_indexes):
+            (ix0, iy0, ix1, iy1), value = self._items[item_index]
+            if ix1 <= x0 or ix0 >= x1 or iy1 <= y0 or iy0 >= y1:
+                continue
+            values.append(value)
+        return values
+
+    def intersects(self, rect):
+        return len(self.query(rect)) > 0
+
+    def query_point(self, x, y):
+        '''Return values of rects that contain point, border is included.'''
+        size = self.cell_size
+        values = []
+        for item_index in self._cells.get((int(x // size), int(y // size)), ()):
+            (x0, y0, x1, y1), value = self._items[item_index]
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                values.append(value)
+        return values
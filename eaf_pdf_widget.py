@@ -26,14 +26,15 @@ import webbrowser
 import fitz
 from core.utils import *
 from eaf_pdf_annot import AnnotAction
-from eaf_pdf_document import PdfDocument
+from eaf_pdf_cache import PdfDiskCache, PdfPageMetaCache, PdfPixmapCache, file_fingerprint
+from eaf_pdf_document import PdfDocument, PdfDocumentReloader, PdfPageGeometry, load_page_sizes, scan_trim_clip
+from eaf_pdf_render import PdfPrefetcher, PdfRenderProcessPool, PdfRenderWorker, RenderTask
 from eaf_pdf_utils import support_hit_max
-from PyQt6.QtCore import QEvent, QPoint, QRect, Qt, QTimer, pyqtSignal
-from PyQt6.QtGui import QColor, QCursor, QFont, QPainter, QPalette, QBrush
+from PyQt6.QtCore import QEvent, QPoint, QPointF, QRect, QRectF, QSize, Qt, QTimer, pyqtSignal
+from PyQt6.QtGui import QColor, QCursor, QFont, QPainter, QPalette, QPen, QPolygonF, QBrush, QPixmap
 from PyQt6.QtWidgets import QApplication, QToolTip, QWidget
 import os
 from pathlib import Path
-from itertools import accumulate
 
 
 class PdfViewerWidget(QWidget):
@@ -66,7 +67,10 @@ class PdfViewerWidget(QWidget):
          self.text_highlight_annot_color,
          self.text_underline_annot_color,
          self.inline_text_annot_color,
-         self.inline_text_annot_fontsize) = get_emacs_vars([
+         self.inline_text_annot_fontsize,
+         self.render_cache_mb,
+         self.render_processes,
+         self.disk_cache_mb) = get_emacs_vars([
              "eaf-marker-letters",
              "eaf-pdf-dark-mode",
              "eaf-pdf-dark-exclude-image",
@@ -76,7 +80,10 @@ class PdfViewerWidget(QWidget):
              "eaf-pdf-text-highlight-annot-color",
              "eaf-pdf-text-underline-annot-color",
              "eaf-pdf-inline-text-annot-color",
-             "eaf-pdf-inline-text-annot-fontsize"
+             "eaf-pdf-inline-text-annot-fontsize",
+             "eaf-pdf-render-cache-mb",
+             "eaf-pdf-render-processes",
+             "eaf-pdf-disk-cache-mb"
              ])
 
         self.theme_mode = get_emacs_theme_mode()
@@ -110,6 +117,7 @@ class PdfViewerWidget(QWidget):
         self.link_page_offset_x = None
         self.link_page_offset_y = None
         self.jump_link_key_cache_dict = {}
+        self.jump_link_tips_dict = {}    # page index -> [(key, tip rect, link), ...]
 
         # hover link
         self.is_hover_link = False
@@ -124,7 +132,7 @@ class PdfViewerWidget(QWidget):
         self.search_page_quad_list = [] # [(page_index, quad), ...]
         self.current_search_quad = None
         self.current_search_page = None
-        self.rendered_searched_quads = {}
+        self.search_page_quads_dict = {}    # page index -> [quad, ...], for overlay
 
         # select text
         self.is_select_mode = False
@@ -169,6 +177,15 @@ class PdfViewerWidget(QWidget):
         self.is_move_text_annot_handler_waiting = False
         self.move_text_annot_pos = (None, None)
 
+        # Mouse move is handled once per frame, with cursor position at that time.
+        self.mouse_move_timer = QTimer()
+        self.mouse_move_timer.setInterval(16)
+        self.mouse_move_timer.setSingleShot(True)
+        self.mouse_move_timer.timeout.connect(self.handle_mouse_move)    # type: ignore
+        # (page, rect, shape) of last hovered char, link or annot, skip hit test while cursor in rect.
+        self.mouse_hover_area = None
+        self.cursor_shape = None
+
         # Init scroll attributes.
         self.scroll_offset = 0
         self.scroll_offset_before_presentation = 0
@@ -197,12 +214,61 @@ class PdfViewerWidget(QWidget):
         self.page_annotate_padding_y = 10
 
         self.default_progress_font_size = 24
-        # Page cache.
-        self.page_cache_pixmap_dict = {}
-        self.page_cache_scale = self.scale
+        # Page cache, key is (page index, scale, rotation, render mode).
+        # Pixmaps of other scales are kept to draw placeholder when zoom.
+        self.page_cache = PdfPixmapCache(self.render_cache_mb * 1024 * 1024)
         self.page_cache_trans = None
+
+        # Page rasters saved on disk, paint last viewport immediately when document reopened.
+        self.disk_cache = PdfDiskCache(os.path.join(get_emacs_config_dir(), "pdf", "cache", "raster"),
+                                       self.disk_cache_mb * 1024 * 1024)
+        # Page metadata (image rects of dark mode) computed by render worker, saved with document fingerprint.
+        self.page_meta_cache = PdfPageMetaCache(os.path.join(get_emacs_config_dir(), "pdf", "cache", "meta"))
         self.page_cache_context_delay = 1000
 
+        # Render results of older generation are dropped, bump it when page cache invalidated.
+        self.render_generation = 0
+        self.page_render_generations = {}    # page index -> generation, bump it when page invalidated
+        self.render_worker = None
+
+        # Changed file is opened in background, then swapped with current document.
+        self.document_reloader = None
+
+        # Page sizes after first page are estimated until page size table is read in background,
+        # page position restored from session is applied again when it's read.
+        self.is_page_sizes_estimated = False
+        self.restored_page_position = None
+
+        # Pages without text are scanned from thumbnails once for document, when trim margin mode enabled.
+        self.document_fingerprint = None
+        self.raster_scan_document = None
+
+        # Cache keys used by current paint, they are pinned in cache.
+        self.painted_cache_keys = []
+
+        # Render visible tiles only when whole page pixmap is too big for page cache,
+        # cache should hold tile_render_page_count pages at least, with prefetched pages.
+        self.tile_size = 512
+        self.tile_render_page_count = 3
+
+        # Prefetch pages in scroll direction.
+        self.prefetcher = PdfPrefetcher()
+
+        # Render draft pages when scrolling fast, refine them after scrolling settles.
+        self.draft_scale_ratio = 0.5
+        self.draft_aa_level = 2
+        self.refine_timer = QTimer()
+        self.refine_timer.setInterval(250)
+        self.refine_timer.setSingleShot(True)
+        self.refine_timer.timeout.connect(self.update)    # type: ignore
+
+        # Pages are painted to offscreen viewport pixmap, scrolling shifts it and paints exposed strip only.
+        # Widget in QGraphicsProxyWidget is repainted whole by QWidget.scroll, so pixels are shifted by ourselves.
+        self.viewport_pixmap = None
+        self.viewport_exposed_rect = QRect()
+        self.is_viewport_dirty = True
+        self.cleaned_page_range = None
+
         self.last_action_time = 0
 
         self.is_page_just_changed = False
@@ -235,110 +301,245 @@ class PdfViewerWidget(QWidget):
         self.setAutoFillBackground(True)
         self.setPalette(pal)
 
-    def load_document(self, url):
-        if self.page_cache_pixmap_dict:
-            self.page_cache_pixmap_dict.clear()
-            self.document.reset_cache()
-
+    def load_document(self, url, fitz_document=None, fingerprint=None, changed_pages=None):
+        '''
+        Load document of url, or fitz_document opened by reloader.
+        changed_pages is indexes of pages that changed since current document, None if all pages changed.
+        '''
         # Load document first.
         try:
-            self.document = PdfDocument(fitz.open(url))    # type: ignore
+            document = PdfDocument(fitz_document or fitz.open(url))    # type: ignore
         except Exception:
             message_to_emacs("Failed to load PDF file: " + url)
             return
 
+        if self.render_worker is not None:
+            # File changed (such as LaTeX recompile), keep pixmaps, text layer and sizes of unchanged pages.
+            if changed_pages is None:
+                self.invalidate_page_cache(reason="reload")
+            else:
+                document.inherit_pages(self.document, changed_pages)
+                self.invalidate_page_cache(changed_pages, "reload")
+        self.document = document
+
         # recompute width, height, total number since the file might be modified
         self.document.watch_page_size_change(self.update_page_size)
         self.page_width = self.document.get_page_width()
         self.page_height = self.document.get_page_height()
+        if fingerprint is None:
+            try:
+                fingerprint = file_fingerprint(url)
+            except OSError:
+                pass
+        self.disk_cache.set_document(fingerprint)
+        self.page_meta_cache.set_document(fingerprint)
+
+        is_page_sizes_estimated, self.is_page_sizes_estimated = self.is_page_sizes_estimated, False
+        if changed_pages is not None and self.document.page_count == self.page_total_number:
+            for index in changed_pages:
+                self.page_geometry.set_page_size(index, *self.document.get_page_size(index))
+
+            # Sizes of unchanged pages are still estimated, sizes loaded for last document are dropped, read them again.
+            if is_page_sizes_estimated:
+                self.is_page_sizes_estimated = True
+                load_page_sizes(url, fingerprint,
+                                lambda widths, heights: self.handle_page_sizes_loaded(document, widths, heights))
+        else:
+            # Page sizes are saved with document fingerprint, reopened document don't need read them again.
+            page_sizes = self.page_meta_cache.get(("document", ), "page_sizes")
+            if page_sizes is not None and len(page_sizes[0]) == self.document.page_count:
+                page_widths, page_heights = page_sizes
+            else:
+                # Paint first page before all page sizes are read, size table is filled in background.
+                page_widths, page_heights, is_exact = self.document.get_estimated_widths_heights()
+                if not is_exact:
+                    self.is_page_sizes_estimated = True
+                    load_page_sizes(url, fingerprint,
+                                    lambda widths, heights: self.handle_page_sizes_loaded(document, widths, heights))
+            self.page_geometry = PdfPageGeometry(page_widths, page_heights)
         self.page_total_number = self.document.page_count
-        self.page_widths, self.page_heights = self.document.get_all_widths_heights()
-        self.page_heights_prefix_sum = list(accumulate(self.page_heights))
-        self.is_standard_doc = False
-        if len(set(self.page_widths)) == 1:
-            self.offset_y_to_render_y = self.offset_y_to_render_y1
-            self.is_standard_doc = True
+
+        # Clip of trim margin mode is scanned in background and saved, it's ready when trim mode enabled.
+        self.document_fingerprint = fingerprint
+        trim_clip = self.page_meta_cache.get(("document", ), "trim_clip")
+        if trim_clip is not None:
+            self.document.set_raster_pages(self.page_meta_cache.get(("document", ), "raster_pages") or [])
+            self.document.set_trim_clip(fitz.Rect(trim_clip) if trim_clip else None)
+            self.scan_raster_trim_clip()
+        elif self.document.is_pdf:
+            # Scan changed pages of reloaded document only, clip of unchanged pages is known.
+            trim_clip, is_scanned = self.document.get_trim_clip()
+            scan_pages = changed_pages if changed_pages is not None and is_scanned else None
+            known_raster_pages = self.document.get_raster_pages() if scan_pages is not None else []
+            scan_trim_clip(url, fingerprint,
+                           lambda clip, raster_pages, is_final: self.handle_trim_clip_scanned(
+                               document, clip, sorted(set(known_raster_pages + raster_pages)), is_final),
+                           scan_pages, trim_clip if scan_pages is not None else None,
+                           meta_cache=self.page_meta_cache)
+
+        if self.document_reloader is None:
+            self.document_reloader = PdfDocumentReloader(url, self.handle_document_reloaded)
+        self.document_reloader.set_document(fingerprint)
+
+        # Render worker open its own document, reopen it when file changed.
+        if self.render_worker is None:
+            if self.render_processes > 0:
+                self.render_worker = PdfRenderProcessPool(url, self.handle_page_render_finished, self.render_processes,
+                                                          self.page_meta_cache, self.disk_cache)
+            else:
+                self.render_worker = PdfRenderWorker(url, self.handle_page_render_finished, self.page_meta_cache,
+                                                     self.disk_cache)
         else:
-            self.offset_y_to_render_y = self.offset_y_to_render_y2
+            # Render the version that reloader validated, file may be written again by LaTeX.
+            self.render_worker.reload(fingerprint)
 
-        # Register file watcher, when document is change, re-calling this function.
-        self.document.watch_file(url, self.load_document)
+        # Register file watcher, when document is change, reload it in background.
+        self.document.watch_file(url, self.handle_file_changed)
 
         self.update()
+
+    @PostGui()
+    def handle_page_sizes_loaded(self, document, page_widths, page_heights):
+        if document is not self.document or len(page_heights) != self.page_total_number:
+            return
+
+        self.is_page_sizes_estimated = False
+        self.page_meta_cache.put(("document", ), "page_sizes", [page_widths, page_heights])
+        position, self.restored_page_position = self.restored_page_position, None
+        if self.page_geometry.is_same_sizes(page_widths, page_heights):
+            return
+
+        if position is not None:
+            # Offset of restored position was computed with estimated sizes, compute it again.
+            self.page_geometry = PdfPageGeometry(page_widths, page_heights)
+            self.scroll_offset = min(self.page_y_to_offset_y(*position), self.max_scroll_offset())
+            self.update()
+            return
+
+        # Estimated sizes of pages before current page are replaced.
+        def change_layout():
+            self.page_geometry = PdfPageGeometry(page_widths, page_heights)
+        self.relayout_keep_position(change_layout)
+
+    @PostGui()
+    def handle_trim_clip_scanned(self, document, clip, raster_pages, is_final):
+        if document is not self.document:
+            return
+
+        if is_final:
+            self.page_meta_cache.put(("document", ), "trim_clip", list(clip) if clip is not None else [])
+            self.page_meta_cache.put(("document", ), "raster_pages", raster_pages)
+        self.document.set_raster_pages(raster_pages)
+        # Page layout and pixmaps are changed only if clip changed.
+        self.document.set_trim_clip(clip, is_final)
+
+        if is_final:
+            self.scan_raster_trim_clip()
+
+    def scan_raster_trim_clip(self):
+        '''
+        Add content of pages without text (scanned pages) to trim clip, it's detected from thumbnails.
+        Rendering thumbnails of whole document is slow, only scan them when trim margin mode is enabled.
+        '''
+        document = self.document
+        raster_pages = document.get_raster_pages()
+        trim_clip, is_scanned = document.get_trim_clip()
+        # Wait text scan of all pages, it finds all pages without text.
+        if (not document.is_trim_margin() or not is_scanned or not raster_pages or
+            self.raster_scan_document is document):
+            return
+
+        self.raster_scan_document = document
+        scan_trim_clip(self.url, self.document_fingerprint,
+                       lambda clip, raster_pages, is_final: self.handle_trim_clip_scanned(
+                           document, clip, raster_pages, is_final),
+                       raster_pages, trim_clip, raster=True,
+                       process_count=max(self.render_processes, 2), meta_cache=self.page_meta_cache)
+
+    def restore_page_position(self, page_index, page_y):
+        '''
+        Scroll to page_y (in points) of page, such as position saved in session.
+        It's applied again when exact page sizes loaded if user doesn't scroll before.
+        '''
+        page_index = max(0, min(page_index, self.page_total_number - 1))
+        self.scroll_offset = self.page_y_to_offset_y(page_index, page_y)
+        self.scroll_offset_before_presentation = self.scroll_offset
+        if self.is_page_sizes_estimated:
+            self.restored_page_position = (page_index, page_y)
+
+    def relayout_keep_position(self, change_layout):
+        '''Call change_layout that changes page sizes or clip, keep current position in the same page.'''
+        # Page geometry isn't updated yet, it's still the layout of last paint.
+        geometry = self.page_geometry
+        if not geometry.has_layout():
+            change_layout()
+            self.update()
+            return
+
+        page_index = min(geometry.find_page(self.scroll_offset), self.page_total_number - 1)
+        local_y = self.scroll_offset - geometry.get_page_offset(page_index)
+        ratio = min(max(local_y / (geometry.get_page_size(page_index)[1] * geometry.get_scale()), 0), 1)
+
+        change_layout()
+
+        self.scroll_offset = min(self.page_y_to_offset_y(page_index, ratio * self.get_page_placeholder_size(page_index)[1]),
+                                 self.max_scroll_offset())
+        self.update()
+
+    def handle_file_changed(self, url):
+        self.document_reloader.request()
+
+    @PostGui()
+    def handle_document_reloaded(self, fitz_document, fingerprint, changed_pages):
+        # Swap document in one step, old document is painted until now.
+        self.load_document(self.url, fitz_document, fingerprint, changed_pages)
     
-    def offset_y_to_render_y1(self, y):
+    def get_page_geometry(self):
+        '''Return page geometry of current layout, offsets are recomputed only when layout changed.'''
+        self.page_geometry.update(self.scale, self.page_padding, self.rotation, self.document.get_page_clip())
+        return self.page_geometry
+
+    def offset_y_to_render_y(self, y):
         """
-        Using simple algebra to convert global offset y coordinate to page_index and local y coordinate
-        
+        Convert global offset y coordinate to page_index and local y coordinate
+        relative to the left top corner of the rendered page.
+
         Return: page_index, accumulated_y before page_index, local y
         """
-        rendered_page_height = self.page_height * self.scale + self.page_padding
-        page_index = int(y / rendered_page_height)
-        if page_index == 0:
-            return 0, 0, y
-        accumulated_height = page_index * rendered_page_height
+        geometry = self.get_page_geometry()
+        page_index = geometry.find_page(y)
+        accumulated_height = geometry.get_page_offset(page_index)
         return page_index, accumulated_height, y - accumulated_height
-        
+
     def accumulate_page_heights(self, page_index=None):
         """
         accumulate page heights and paddings (include padding in the end of page_index)
         """
-        if page_index is None:
-            page_index = self.page_total_number-1
+        geometry = self.get_page_geometry()
+        if page_index is None or page_index >= self.page_total_number - 1:
+            return geometry.get_total_height()
         if page_index < 0:
             return 0
-        paddings = page_index+1 if page_index != self.page_total_number-1 else page_index
-        padding_height = self.page_padding * paddings
-        accumulated_height = self.page_heights_prefix_sum[page_index] * self.scale + padding_height
-        return accumulated_height
-        
-    def offset_y_to_render_y2(self, y):
-        """
-        Using prefix sum array to convert global offset y coordinate to page_index and local y coordinate 
-        relative to the left top corner of the rendered page. this is slower than offset_y_to_render_y1
-        
-        Return: page_index, accumulated_y before page_index, local y
-        """
-        
-        left, right = 0, self.page_total_number - 1
-        while left <= right:
-            mid = (left + right) // 2
-            accumulated_height = self.accumulate_page_heights(mid)
-            if accumulated_height < y:
-                left = mid + 1
-            else:
-                right = mid - 1
-        page_index = left
-        if page_index == 0:
-            return 0, 0, y
-        else:
-            accumulated_height = self.accumulate_page_heights(page_index - 1)
-            return page_index, accumulated_height, y - accumulated_height
-        
+        return geometry.get_page_offset(page_index + 1)
+
     def window_y_to_page_y(self, y):
         """
         Given y coordinate relative to the top of the window (e.g. cursor position), 
         Returned the page index and y coordinate relative to the page of pymupdf.
         """
-        render_offset = y + self.top_y
-        for index in range(self.start_page_index, self.last_page_index):
-            page_height = self.page_heights[index] * self.scale + self.page_padding
-            if render_offset < page_height:
-                break
-            render_offset -= page_height
+        offset = self.get_page_geometry().get_page_offset(self.start_page_index) + self.top_y + y
+        index, _, render_offset = self.offset_y_to_render_y(offset)
         if index >= self.page_total_number:
             index = None
         return index, render_offset / self.scale
-    
+
     def page_y_to_offset_y(self, page_index, y=0):
         """
         Given page index and y coordinate relative to the page (e.g. quad.ul.y),
         return the global y offset, mainly used for jump.
         """
-        accumulated_height = self.accumulate_page_heights(page_index - 1)
-        offset_y = accumulated_height + y * self.scale
-        return offset_y
-    
+        return self.get_page_geometry().get_page_offset(page_index) + y * self.scale
+
     def is_buffer_focused(self):
         # This check is slow, use only when necessary
         try:
@@ -446,72 +647,185 @@ class PdfViewerWidget(QWidget):
             self.update()
             message_to_emacs("Jumped to next saved position.")
 
-    def get_page_pixmap(self, index, scale, rotation=0):
-        # Just return cache pixmap when found match index and scale in cache dict.
-        if self.page_cache_scale == scale:
-            if index in self.page_cache_pixmap_dict.keys():
-                return self.page_cache_pixmap_dict[index]
-        # Clear dict if page scale changed.
+    def invalidate_page_cache(self, pages=None, reason="unknown"):
+        '''
+        Remove cached pixmaps of pages (all pages if pages is None) and drop their pending render results.
+        reason is one of annotation, theme, geometry, reload, it's counted in cache stats.
+        '''
+        self.page_cache.invalidate(pages, reason)
+        if pages is None:
+            self.render_generation += 1
+            self.page_render_generations.clear()
+            if self.render_worker is not None:
+                self.render_worker.cancel()
         else:
-            self.page_cache_pixmap_dict.clear()
-            self.page_cache_scale = scale
+            for index in pages:
+                self.page_render_generations[index] = self.page_render_generations.get(index, 0) + 1
 
-        page = self.document[index]
-        if self.document.is_pdf:
-            page.set_rotation(rotation)
+    def get_render_generation(self, index):
+        return (self.render_generation, self.page_render_generations.get(index, 0))
 
-        if self.is_mark_link:
-            page.add_mark_link()
-        else:
-            page.cleanup_mark_link()
+    def get_page_pixmap(self, index, scale, rotation=0):
+        '''
+        Return page pixmap, or None if page is rendering in background.
+        '''
+        # Just return cache pixmap when found match key in cache.
+        key = self.get_page_cache_key(index, scale, rotation)
+        self.painted_cache_keys.append(key)
+        qpixmap = self.page_cache.get(key)
+        if qpixmap is not None:
+            return qpixmap
+
+        # Raster saved on disk is decoded by render worker, don't render draft of it.
+        if self.prefetcher.is_fast_scrolling() and key not in self.disk_cache:
+            # Page only stays a few frames on screen, render draft page and refine it later.
+            draft_scale = self.get_draft_scale(scale)
+            draft_key = self.get_page_cache_key(index, draft_scale, rotation, self.draft_aa_level)
+            self.painted_cache_keys.append(draft_key)
+            if draft_key not in self.page_cache:
+                self.render_worker.request(draft_key, self.make_render_task(index, draft_scale, rotation,
+                                                                            aa_level=self.draft_aa_level),
+                                           self.get_render_priority(index))
+            self.refine_timer.start()
+            return None
 
-        # follow page search text
-        old_annots_on_page = self.rendered_searched_quads.get(index, [])
-        page.cleanup_search_text(old_annots_on_page)
-        if self.is_mark_search:
-            highlights = page.mark_search_text(self.search_term, self.current_search_quad)
-            # this is the actual rendered quads, collect for cleanup
-            self.rendered_searched_quads[index] = highlights
+        self.render_worker.request(key, self.make_render_task(index, scale, rotation), self.get_render_priority(index))
+        return None
 
-        if self.is_jump_link:
-            self.jump_link_key_cache_dict.update(page.mark_jump_link_tips(self.marker_letters))
-        else:
-            page.cleanup_jump_link_tips()
-            self.jump_link_key_cache_dict.clear()
+    def get_render_priority(self, index, page_y=None):
+        '''
+        Return distance from center of page (or page_y in page, in pixels) to center of window,
+        page that user is reading renders first.
+        '''
+        geometry = self.get_page_geometry()
+        if page_y is None:
+            page_y = geometry.get_page_size(index)[1] * self.scale / 2
+        return abs(geometry.get_page_offset(index) + page_y - self.scroll_offset - self.rect().height() / 2)
+
+    def make_render_task(self, index, scale, rotation, tile_clip=None, aa_level=None):
+        return RenderTask(index, scale, rotation, self.get_inverted_mode(), self.inverted_image_mode,
+                          self.document.get_page_render_clip(index), self.get_render_generation(index), tile_clip, aa_level,
+                          self.need_render_alpha(), self.disk_cache.fingerprint)
+
+    def need_render_alpha(self):
+        # Transparent page background show render background color, it's same as white background of RGB render.
+        return self.get_inverted_mode() or QColor(self.get_render_background_color()) != QColor(Qt.GlobalColor.white)
 
-        qpixmap = page.get_qpixmap(scale, self.get_inverted_mode(), self.inverted_image_mode)
+    def get_draft_scale(self, scale):
+        return round(scale * self.draft_scale_ratio, 2)
 
-        self.page_cache_pixmap_dict[index] = qpixmap
-        self.document.cache_page(index, page)
+    def get_render_mode(self):
+        clip = self.document.get_page_clip()
+        return (self.get_inverted_mode(), self.inverted_image_mode, tuple(clip) if clip is not None else None,
+                self.need_render_alpha())
 
-        return qpixmap
+    def get_page_cache_key(self, index, scale, rotation, aa_level=None):
+        # Draft page renders with lower anti-aliasing level, don't mix it with full quality page of same scale.
+        return (index, scale, rotation, self.get_render_mode(), aa_level)
+
+    def is_page_pixmap_ready(self, index):
+        return self.get_page_cache_key(index, self.scale * self.devicePixelRatioF(), self.rotation) in self.page_cache
+
+    def find_nearest_page_cache_key(self, index, scale, rotation):
+        '''
+        Find cached pixmap of page that scale is nearest to scale, with same rotation and render mode.
+        Full quality page is preferred over draft page of same scale.
+        '''
+        render_mode = self.get_render_mode()
+        nearest_key = None
+        nearest_order = None
+        for key in self.page_cache.page_keys(index):
+            # Skip tiles, tile key is page key with tile position.
+            if len(key) != 5 or key[2] != rotation or key[3] != render_mode:
+                continue
+            is_draft = key[4] is not None
+            order = (abs(math.log(key[1] / scale)), is_draft)
+            if nearest_order is None or order < nearest_order:
+                nearest_key, nearest_order = key, order
+        return nearest_key
+
+    @PostGui()
+    def handle_page_render_finished(self, key, task, image):
+        # Drop result if page cache invalidated after request.
+        if task.generation != self.get_render_generation(task.page_index):
+            self.render_worker.release(task)
+            return
+
+        self.page_cache.put(key, QPixmap.fromImage(image))
+        self.render_worker.release(task)
+        self.update()
 
     def get_page_render_info(self, index):
+        '''
+        Return page pixmap and render size, pixmap is placeholder or None when page is rendering in background.
+        '''
         # Get HiDPI scale factor.
         # Note:
         # Don't delete hidpi_scale_factor even it value is 1.0,
         # PDF page will become blurred if delete this variable.
         hidpi_scale_factor = self.devicePixelRatioF()
+        scale = self.scale * hidpi_scale_factor
 
         # Get page pixmap.
-        qpixmap = self.get_page_pixmap(index, self.scale * hidpi_scale_factor, self.rotation)
+        qpixmap = self.get_page_pixmap(index, scale, self.rotation)
+
+        if qpixmap is not None:
+            return (qpixmap, qpixmap.width() / hidpi_scale_factor, qpixmap.height() / hidpi_scale_factor)
 
-        page_render_width = qpixmap.width() / hidpi_scale_factor
-        page_render_height = qpixmap.height() / hidpi_scale_factor
+        # Use nearest cached resolution as placeholder, it will be stretched to the size of current scale.
+        key = self.find_nearest_page_cache_key(index, scale, self.rotation)
+        if key is not None:
+            qpixmap = self.page_cache.peek(key)
+            ratio = scale / key[1]
+            return (qpixmap, qpixmap.width() * ratio / hidpi_scale_factor, qpixmap.height() * ratio / hidpi_scale_factor)
 
-        return (qpixmap, page_render_width, page_render_height)
+        page_width, page_height = self.get_page_placeholder_size(index)
+        return (None, page_width * self.scale, page_height * self.scale)
+
+    def get_page_placeholder_size(self, index):
+        return self.get_page_geometry().get_page_size(index)
 
     def clean_unused_page_cache_pixmap(self):
-        # We need expand render index bound that avoid clean cache around current index.
-        index_list = list(range(self.start_page_index, self.last_page_index))
+        # Visible pages are never evicted, other pages are evicted by LRU order when over memory budget.
+        visible_keys = self.painted_cache_keys
+        self.page_cache.pin(visible_keys)
 
-        # Try to clean unused cache.
-        cache_index_list = list(self.page_cache_pixmap_dict.keys())
+        # Don't render pages that scrolled out.
+        self.render_worker.retain(visible_keys)
 
-        for cache_index in cache_index_list:
-            if cache_index not in index_list:
-                self.page_cache_pixmap_dict.pop(cache_index)
-                self.document.remove_cache(cache_index)
+    def prefetch_pages(self):
+        '''Render pages ahead of scroll direction at idle priority.'''
+        if self.read_mode == "fit_to_presentation":
+            start_page_index, last_page_index = self.start_page_index, self.start_page_index + 1
+        else:
+            start_page_index, last_page_index = self.start_page_index, self.last_page_index
+
+        scale = self.scale * self.devicePixelRatioF()
+        aa_level = None
+        if self.prefetcher.is_fast_scrolling():
+            scale = self.get_draft_scale(scale)
+            aa_level = self.draft_aa_level
+
+        tasks = {}
+        for index in self.prefetcher.get_prefetch_pages(start_page_index, last_page_index,
+                                                        self.page_total_number, self.render_worker.render_time):
+            if self.is_tile_render(index):
+                continue
+
+            key = self.get_page_cache_key(index, scale, self.rotation, aa_level)
+            if key in self.page_cache:
+                continue
+
+            tasks[key] = self.make_render_task(index, scale, self.rotation, aa_level=aa_level)
+        self.render_worker.prefetch(tasks)
+
+    def record_scroll(self):
+        page_height = self.page_height * self.scale + self.page_padding
+        if self.read_mode == "fit_to_presentation":
+            offset = self.start_page_index * page_height
+        else:
+            offset = self.scroll_offset
+        self.prefetcher.record_scroll(offset, page_height)
 
     def resizeEvent(self, event):
         # Update scale attributes after widget resize.
@@ -563,9 +877,50 @@ class PdfViewerWidget(QWidget):
             # Alwasy render BLACK font.
             return "#000000"
 
+    def update(self, *args):
+        # Anything but scrolling may change painted pages, repaint whole viewport pixmap.
+        self.is_viewport_dirty = True
+        super().update(*args)
+
     def paintEvent(self, event):
-        # Init painter.
         painter = QPainter(self)
+        if self.is_blit_scroll_enabled():
+            self.update_viewport_pixmap()
+            painter.drawPixmap(0, 0, self.viewport_pixmap)
+        else:
+            self.viewport_pixmap = None
+            self.draw_viewport(painter, True)
+
+        # Render progress information, it's fixed on window, so it's not painted in viewport pixmap.  # type: ignore
+        painter.setPen(QColor(self.get_render_foreground_color()))
+        self.update_page_progress(painter)
+
+    def update_viewport_pixmap(self):
+        '''Paint exposed area of viewport pixmap, other area is reused from last paint.'''
+        hidpi_scale_factor = self.devicePixelRatioF()
+        size = QSize(int(self.width() * hidpi_scale_factor), int(self.height() * hidpi_scale_factor))
+        if (self.viewport_pixmap is None or self.viewport_pixmap.size() != size or
+            self.viewport_pixmap.devicePixelRatio() != hidpi_scale_factor):
+            self.viewport_pixmap = QPixmap(size)
+            self.viewport_pixmap.setDevicePixelRatio(hidpi_scale_factor)
+            self.is_viewport_dirty = True
+
+        exposed_rect = self.rect() if self.is_viewport_dirty else self.viewport_exposed_rect
+        self.is_viewport_dirty = False
+        self.viewport_exposed_rect = QRect()
+        if exposed_rect.isEmpty():
+            return
+
+        painter = QPainter(self.viewport_pixmap)
+        painter.setClipRect(exposed_rect)
+        painter.fillRect(exposed_rect, self.palette().color(QPalette.ColorRole.Window))
+        self.draw_viewport(painter, exposed_rect.contains(self.rect()))
+        painter.end()
+
+    def draw_viewport(self, painter, is_full_paint):
+        self.painted_cache_keys = []
+
+        # Init painter.
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
         painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceAtop)
         painter.save()
@@ -582,23 +937,21 @@ class PdfViewerWidget(QWidget):
             self.draw_scroll_pages(painter)
 
         # Clean unused pixmap cache that avoid use too much memory.
-        self.clean_unused_page_cache_pixmap()
+        # Visible pages of strip paint after scroll are same as last paint, skip it.
+        page_range = (self.start_page_index, self.last_page_index)
+        if is_full_paint or page_range != self.cleaned_page_range:
+            self.clean_unused_page_cache_pixmap()
+            self.cleaned_page_range = page_range
+
+        self.prefetch_pages()
 
         # Restore painter.
         painter.restore()
 
-        # Render progress information.  # type: ignore
-        painter.setPen(QColor(self.get_render_foreground_color()))
-        self.update_page_progress(painter)
-
     def draw_presentation_page(self, painter, index):
         # Get page render information.
         (qpixmap, self.page_render_width, self.page_render_height) = self.get_page_render_info(index)
 
-        # Select char area when is_select_mode is True.
-        if self.is_select_mode:
-            qpixmap = self.mark_select_obj_area(index, qpixmap)
-
         # Init x and y coordinate.
         page_render_x = (self.rect().width() - self.page_render_width) / 2
         page_render_y = (self.rect().height() - self.page_render_height) / 2
@@ -622,7 +975,13 @@ class PdfViewerWidget(QWidget):
         # Draw page.
         rect = QRect(int(page_render_x), int(page_render_y), int(self.page_render_width), int(self.page_render_height))
         painter.drawRect(rect)
-        painter.drawPixmap(rect, qpixmap)
+        if qpixmap is not None:
+            painter.drawPixmap(rect, qpixmap)
+
+            # Select char area when is_select_mode is True.
+            if self.is_select_mode and self.is_page_pixmap_ready(index):
+                self.draw_page_select_area(painter, index, QRectF(rect), qpixmap.width())
+        self.draw_page_overlay(painter, index, QRectF(rect))
 
     def draw_scroll_pages(self, painter):
         max_scroll_offset = self.max_scroll_offset()
@@ -642,20 +1001,34 @@ class PdfViewerWidget(QWidget):
         index = self.start_page_index
         while all_translated_height < window_height:
             # Draw page.
-            page_render_y = self.draw_scroll_page(painter, index)
+            page_render_y = self.draw_scroll_page(painter, index, all_translated_height)
             painter.translate(0, page_render_y)
             all_translated_height += page_render_y
             index += 1
         self.last_page_index = index
 
-    def draw_scroll_page(self, painter, index):
+    def draw_scroll_page(self, painter, index, page_top_y=0):
+        if self.is_tile_render(index):
+            return self.draw_scroll_page_tiles(painter, index, page_top_y)
+
         # Get page render information.
         (qpixmap, self.page_render_width, self.page_render_height) = self.get_page_render_info(index)
 
-        # Select char area when is_select_mode is True.
-        if self.is_select_mode:
-            qpixmap = self.mark_select_obj_area(index, qpixmap.copy())
+        page_render_x = self.get_page_render_x()
+
+        rect = QRect(int(page_render_x), 0, int(self.page_render_width), int(self.page_render_height))
+        painter.drawRect(rect)
+        if qpixmap is not None:
+            painter.drawPixmap(rect, qpixmap)
+
+            # Select char area when is_select_mode is True.
+            if self.is_select_mode and self.is_page_pixmap_ready(index):
+                self.draw_page_select_area(painter, index, QRectF(rect), qpixmap.width())
+        self.draw_page_overlay(painter, index, QRectF(page_render_x, 0, self.page_render_width, self.page_render_height))
+        self.draw_page_extra(painter, index, page_render_x)
+        return self.page_render_height + self.page_padding
 
+    def get_page_render_x(self):
         # Init x coordinate.
         page_render_x = (self.rect().width() - self.page_render_width) / 2
 
@@ -664,12 +1037,150 @@ class PdfViewerWidget(QWidget):
             # limit the visiable area size
             page_render_x = max(min(page_render_x + self.horizontal_offset, 0), self.rect().width() - self.page_render_width)
 
-        rect = QRect(int(page_render_x), 0, int(self.page_render_width), int(self.page_render_height))
+        return page_render_x
+
+    def is_tile_render(self, index):
+        page_width, page_height = self.get_page_placeholder_size(index)
+        scale = self.scale * self.devicePixelRatioF()
+        page_bytes = page_width * scale * page_height * scale * 4
+        return page_bytes * self.tile_render_page_count > self.page_cache.max_bytes
+
+    def draw_scroll_page_tiles(self, painter, index, page_top_y):
+        hidpi_scale_factor = self.devicePixelRatioF()
+        scale = self.scale * hidpi_scale_factor
+        page_width, page_height = self.get_page_placeholder_size(index)
+        self.page_render_width = page_width * self.scale
+        self.page_render_height = page_height * self.scale
+        page_render_x = self.get_page_render_x()
+
+        rect = QRectF(page_render_x, 0, self.page_render_width, self.page_render_height)
         painter.drawRect(rect)
-        painter.drawPixmap(rect, qpixmap)
+
+        # Draw low resolution whole page first, tiles will cover it.
+        preview_scale = round(hidpi_scale_factor * math.sqrt(self.rect().width() * self.rect().height() / (page_width * page_height)), 2)
+        preview_pixmap = self.get_page_pixmap(index, preview_scale, self.rotation)
+        if preview_pixmap is None:
+            preview_key = self.find_nearest_page_cache_key(index, scale, self.rotation)
+            if preview_key is not None:
+                preview_pixmap = self.page_cache.peek(preview_key)
+        if preview_pixmap is not None:
+            painter.drawPixmap(rect, preview_pixmap, QRectF(preview_pixmap.rect()))
+
+        # Visible area of page, in device pixel.
+        visible_x0 = max(0, -page_render_x) * hidpi_scale_factor
+        visible_y0 = max(0, -page_top_y) * hidpi_scale_factor
+        visible_x1 = min(self.page_render_width, self.rect().width() - page_render_x) * hidpi_scale_factor
+        visible_y1 = min(self.page_render_height, self.rect().height() - page_top_y) * hidpi_scale_factor
+
+        tile_size = self.tile_size
+        page_key = self.get_page_cache_key(index, scale, self.rotation)
+        for tile_y in range(int(visible_y0 // tile_size), int(math.ceil(visible_y1 / tile_size))):
+            for tile_x in range(int(visible_x0 // tile_size), int(math.ceil(visible_x1 / tile_size))):
+                key = page_key + ((tile_x, tile_y), )
+                self.painted_cache_keys.append(key)
+
+                tile_pixmap = self.page_cache.get(key)
+                if tile_pixmap is None:
+                    tile_clip = fitz.Rect(tile_x * tile_size / scale, tile_y * tile_size / scale,
+                                          (tile_x + 1) * tile_size / scale, (tile_y + 1) * tile_size / scale)
+                    self.render_worker.request(key, self.make_render_task(index, scale, self.rotation, tile_clip),
+                                               self.get_render_priority(index, (tile_y + 0.5) * tile_size / hidpi_scale_factor))
+                    continue
+
+                tile_rect = QRectF(page_render_x + tile_x * tile_size / hidpi_scale_factor,
+                                   tile_y * tile_size / hidpi_scale_factor,
+                                   tile_pixmap.width() / hidpi_scale_factor,
+                                   tile_pixmap.height() / hidpi_scale_factor)
+                painter.drawPixmap(tile_rect, tile_pixmap, QRectF(tile_pixmap.rect()))
+
+        # Select char area when is_select_mode is True.
+        if self.is_select_mode:
+            self.draw_page_select_area(painter, index, rect, self.page_render_width * hidpi_scale_factor)
+
+        self.draw_page_overlay(painter, index, rect)
         self.draw_page_extra(painter, index, page_render_x)
         return self.page_render_height + self.page_padding
         
+    def has_page_overlay(self, index):
+        return (self.is_mark_link or self.is_jump_link or index in self.search_page_quads_dict or
+                (self.hovered_annot is not None and getattr(self.hovered_annot.parent, "number", None) == index))
+
+    def draw_page_overlay(self, painter, index, rect):
+        '''
+        Draw link underlines, search highlights, jump link tips and hovered annot over page.
+        Marks are painted from geometry, page pixmap don't need render again when marks change.
+        '''
+        if not self.has_page_overlay(index):
+            return
+
+        page = self.document[index]
+        if self.document.is_pdf and page.rotation != self.rotation:
+            page.set_rotation(self.rotation)
+        scale = rect.width() / page.rect.width
+        matrix = page.get_overlay_matrix(scale)
+
+        def to_point(point):
+            point = fitz.Point(point) * matrix
+            return QPointF(point.x, point.y)
+
+        def to_qrectf(r):
+            r = fitz.Rect(r) * matrix
+            return QRectF(r.x0, r.y0, r.width, r.height)
+
+        painter.save()
+        painter.translate(rect.x(), rect.y())
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+        painter.setPen(Qt.PenStyle.NoPen)
+
+        for quad in self.search_page_quads_dict.get(index, []):
+            if index == self.current_search_page and quad == self.current_search_quad:
+                painter.setBrush(QColor(242, 129, 0, 140))
+            else:
+                painter.setBrush(QColor(255, 255, 0, 100))
+            painter.drawPolygon(QPolygonF([to_point(quad.ul), to_point(quad.ur), to_point(quad.lr), to_point(quad.ll)]))
+
+        if self.hovered_annot is not None and getattr(self.hovered_annot.parent, "number", None) == index:
+            annot = self.hovered_annot
+            stroke = annot.colors.get("stroke")
+            r, g, b = stroke if stroke and len(stroke) == 3 else (1.0, 0.84, 0.08)
+            painter.setBrush(QColor(int(r * 255), int(g * 255), int(b * 255), 153))
+
+            vertices = annot.vertices
+            if vertices is not None and len(vertices) % 4 == 0:
+                for i in range(0, len(vertices), 4):
+                    # top-left and bottom-right point
+                    painter.drawRect(to_qrectf(fitz.Rect(vertices[i], vertices[i+3])))
+            else:
+                painter.drawRect(to_qrectf(annot.rect))
+
+        if self.is_mark_link:
+            painter.setPen(QPen(QColor(0, 0, 255), max(1.0, scale)))
+            for link_rect in page.get_link_rects():
+                painter.drawLine(to_point(link_rect.bottom_left), to_point(link_rect.bottom_right))
+
+        if self.is_jump_link:
+            tips = self.get_jump_link_tips(index, page)
+            if tips:
+                fontsize, = get_emacs_vars(["eaf-pdf-marker-fontsize"])
+                font = QFont("Helvetica")
+                font.setPixelSize(max(1, int(fontsize * scale)))
+                painter.setFont(font)
+                for key, tip_rect, _ in tips:
+                    tip_qrect = to_qrectf(tip_rect)
+                    painter.fillRect(tip_qrect, QColor(255, 197, 36))
+                    painter.setPen(QColor(0, 0, 0))
+                    painter.drawText(tip_qrect, Qt.AlignmentFlag.AlignCenter, key)
+
+        painter.restore()
+
+    def get_jump_link_tips(self, index, page):
+        if index not in self.jump_link_tips_dict:
+            fontsize, = get_emacs_vars(["eaf-pdf-marker-fontsize"])
+            tips = page.get_jump_link_tips(self.marker_letters, fontsize)
+            self.jump_link_tips_dict[index] = tips
+            self.jump_link_key_cache_dict.update({key: link for key, _, link in tips})
+        return self.jump_link_tips_dict[index]
+
     def draw_page_extra(self, painter, index, page_render_x):
         # Draw an indicator for synctex/link jump/search in epub
         if self.synctex_info.page_num == index + 1 and self.synctex_info.pos_y is not None:
@@ -783,25 +1294,31 @@ class PdfViewerWidget(QWidget):
                     numSteps = numSteps / 120
                 new_pos = self.scroll_offset - numSteps * self.scroll_step_vertical
                 self.update_vertical_offset(new_pos)    # type: ignore
+                self.record_scroll()
 
             if event.angleDelta().x():
                 new_pos = (self.horizontal_offset + event.angleDelta().x() / 120 * self.scroll_step_horizontal)
                 max_pos = (self.page_width * self.scale - self.rect().width())
                 self.update_horizontal_offset(max(min(new_pos , max_pos), -max_pos))    # type: ignore
 
-    def update_page_size(self, rect):
-        current_page_index = self.start_page_index
-        self.page_width = rect.width
-        self.page_height = rect.height
-        self.jump_to_page(current_page_index)    # type: ignore
+    def update_page_size(self):
+        '''Update layout after page clip changed.'''
+        self.invalidate_page_cache(reason="geometry")
+
+        def change_layout():
+            self.page_width = self.document.get_page_width()
+            self.page_height = self.document.get_page_height()
+            if self.rotation % 180 != 0:
+                self.page_width, self.page_height = self.page_height, self.page_width
+            self.update_scale()
+        self.relayout_keep_position(change_layout)
 
     def build_context_cache(self):
         # Just build context cache when action duration longer than delay
         # Don't build contexnt cache when is_page_just_changed is True, avoid flickr when user change page.
         last_action_duration = (time.time() - self.last_action_time) * 1000
         if last_action_duration > self.page_cache_context_delay and not self.is_page_just_changed:
-            for index in list(range(self.start_page_index, self.last_page_index)):
-                self.get_page_pixmap(index, self.scale, self.rotation)
+            self.prefetch_pages()
 
     def scale_to(self, new_scale):
         self.scroll_offset = new_scale * 1.0 / self.scale * self.scroll_offset
@@ -869,6 +1386,7 @@ class PdfViewerWidget(QWidget):
             self.next_page()
         else:
             self.update_vertical_offset(self.scroll_offset + self.scroll_step_vertical)    # type: ignore
+        self.record_scroll()
 
     @interactive
     def scroll_down(self):
@@ -876,6 +1394,7 @@ class PdfViewerWidget(QWidget):
             self.prev_page()
         else:
             self.update_vertical_offset(self.scroll_offset - self.scroll_step_vertical)    # type: ignore
+        self.record_scroll()
 
     @interactive
     def scroll_up_page(self):
@@ -884,6 +1403,7 @@ class PdfViewerWidget(QWidget):
         else:
             # Adjust scroll step to make users continue reading fluently.
             self.update_vertical_offset(self.scroll_offset + self.rect().height() - self.scroll_step_vertical)    # type: ignore
+        self.record_scroll()
 
     @interactive
     def scroll_down_page(self):
@@ -892,6 +1412,7 @@ class PdfViewerWidget(QWidget):
         else:
             # Adjust scroll step to make users continue reading fluently.
             self.update_vertical_offset(self.scroll_offset - self.rect().height() + self.scroll_step_vertical)    # type: ignore
+        self.record_scroll()
 
     @interactive
     def scroll_right(self):
@@ -955,16 +1476,14 @@ class PdfViewerWidget(QWidget):
 
     @interactive
     def toggle_trim_white_margin(self):
-        current_page_index = self.start_page_index
         self.document.toggle_trim_margin()
-        self.page_cache_pixmap_dict.clear()
-        self.update()
-        self.jump_to_page(current_page_index)    # type: ignore
+        self.update_page_size()
+        self.scan_raster_trim_clip()
 
     @interactive
     def toggle_inverted_mode(self):
         # Need clear page cache first, otherwise current page will not inverted until next page.
-        self.page_cache_pixmap_dict.clear()
+        self.invalidate_page_cache(reason="theme")
 
         self.inverted_mode = not self.inverted_mode
         self.update()
@@ -977,7 +1496,7 @@ class PdfViewerWidget(QWidget):
             message_to_emacs("Only support PDF!")
             return
 
-        self.page_cache_pixmap_dict.clear()
+        self.invalidate_page_cache(reason="theme")
         self.inverted_image_mode = not self.inverted_image_mode
 
         # Re-render page.
@@ -986,7 +1505,6 @@ class PdfViewerWidget(QWidget):
     @interactive
     def toggle_mark_link(self): #  mark_link will add underline mark on link, using prompt link position.
         self.is_mark_link = not self.is_mark_link and self.document.is_pdf
-        self.page_cache_pixmap_dict.clear()
         self.update()
 
     def update_rotate(self, rotate):
@@ -996,7 +1514,7 @@ class PdfViewerWidget(QWidget):
             self.page_width, self.page_height = self.page_height, self.page_width
 
             # Need clear page cache first, otherwise current page will not inverted until next page.
-            self.page_cache_pixmap_dict.clear()
+            self.invalidate_page_cache(reason="geometry")
             self.update_scale()
             self.update()
             self.jump_to_page(current_page_index)    # type: ignore
@@ -1041,14 +1559,14 @@ class PdfViewerWidget(QWidget):
         if new_annot:
             new_annot.set_info(title=annot_action.annot_title)
             new_annot.parent = page
-            self.save_annot()
+            self.save_annot([annot_action.page_index])
 
     def delete_annot_of_action(self, annot_action):
         page = self.document[annot_action.page_index]
         annot = AnnotAction.find_annot_of_annot_action(page, annot_action)
         if annot:
             page.delete_annot(annot)
-            self.save_annot()
+            self.save_annot([annot_action.page_index])
 
     @interactive
     def rotate_counterclockwise(self):
@@ -1090,7 +1608,6 @@ class PdfViewerWidget(QWidget):
 
     def add_mark_jump_link_tips(self):
         self.is_jump_link = True and self.document.is_pdf
-        self.page_cache_pixmap_dict.clear()
         self.update()
 
     def jump_to_link(self, key):
@@ -1126,7 +1643,8 @@ class PdfViewerWidget(QWidget):
 
     def cleanup_links(self):
         self.is_jump_link = False
-        self.page_cache_pixmap_dict.clear()
+        self.jump_link_tips_dict.clear()
+        self.jump_link_key_cache_dict.clear()
         self.update()
 
     def _search_in_pages(self, text, page_list):
@@ -1150,6 +1668,7 @@ class PdfViewerWidget(QWidget):
                     # collect page index and quads just for page and candidates indexing
                     # rendered quads should be collected in paintEvent/get_page_render_info/get_page_pixmap
                     self.search_page_quad_list.append((page_index, quad))
+                    self.search_page_quads_dict.setdefault(page_index, []).append(quad)
 
     def search_text(self, text, init_page_index = None, page_offset=-1):
         # clear the last search
@@ -1188,7 +1707,6 @@ class PdfViewerWidget(QWidget):
                 self.current_search_quad = quad
                 self.current_search_page = page_index
                 self.jump_to_offset(search_text_offset)
-                self.page_cache_pixmap_dict.clear()
                 self.update()
                 if init_page_index is not None: # if search line ,move highlight to center
                     search_text_offset -= self.page_height // 4
@@ -1209,7 +1727,6 @@ class PdfViewerWidget(QWidget):
             message_to_emacs(str(self.search_text_index + 1) + "/" + str(quads_num), False, False)
             self.current_search_quad = quad
             self.current_search_page = page_index
-            self.page_cache_pixmap_dict.clear()
             self.update()
 
     def jump_next_match(self):
@@ -1233,93 +1750,35 @@ class PdfViewerWidget(QWidget):
         """
         remove all search highlights, but may still be in search mode, e.g. search empty string
         """
-        self.page_cache_pixmap_dict.clear()
-        for page_num, annot_list in self.rendered_searched_quads.items():
-            raw_page = self.document.document[page_num]
-            for annot in annot_list:
-                raw_page.delete_annot(annot)
-            annot_list.clear() # make sure we don't have any dangling references
-                
-        self.rendered_searched_quads.clear()
+        self.search_page_quads_dict.clear()
         self.update()
 
-    def get_select_char_list(self):
+    def get_select_char_ranges(self):
+        '''Return dict of page index -> (start, end) char index of select area, end is included.'''
         page_dict = {}
-        if self.start_char_rect_index and self.last_char_rect_index:
-            # start and last page
-            sp_index = min(self.start_char_page_index, self.last_char_page_index)    # type: ignore
-            lp_index = max(self.start_char_page_index, self.last_char_page_index)    # type: ignore
-            for page_index in range(sp_index, lp_index + 1):    # type: ignore
-                page_char_list = self.document[page_index].get_page_char_rect_list()
-
-                if page_char_list:
-                # handle forward select and backward select on multi page.
-                # backward select on multi page.
-                    if self.start_char_page_index > self.last_char_page_index:    # type: ignore
-                        sc = self.last_char_rect_index if page_index == sp_index else 0
-                        lc = self.start_char_rect_index if page_index == lp_index else len(page_char_list)
-                    else:
-                        # forward select on multi page.
-                        sc = self.start_char_rect_index if page_index == sp_index else 0
-                        lc = self.last_char_rect_index if page_index == lp_index else len(page_char_list)
-
-                    # handle forward select and backward select on same page.
-                    sc_index = min(sc, lc)
-                    lc_index = max(sc, lc)
-
-                    page_dict[page_index] = page_char_list[sc_index : lc_index + 1]
-
-        return page_dict
-
-    def get_select_obj_list(self):
-        page_dict = {}
-        if self.start_char_rect_index and self.last_char_rect_index:
-            # start and last page
-            sp_index = min(self.start_char_page_index, self.last_char_page_index)    # type: ignore
-            lp_index = max(self.start_char_page_index, self.last_char_page_index)    # type: ignore
-            for page_index in range(sp_index, lp_index + 1):    # type: ignore
-                # handle forward select and backward select on multi page.
-                # backward select on multi page.
-                if self.start_char_page_index > self.last_char_page_index:    # type: ignore
-                    sc = self.last_char_rect_index if page_index == sp_index else (0, 0, 0, 0)
-                    lc = self.start_char_rect_index if page_index == lp_index else (-1, -1, -1, -1)
-                else:
-                    # forward select on multi page.
-                    sc = self.start_char_rect_index if page_index == sp_index else (0, 0, 0, 0)
-                    lc = self.last_char_rect_index if page_index == lp_index else (-1, -1, -1, -1)
-
-                # handle forward select and backward select on same page.
-                
-                if -1 in sc:
-                    sc_index, lc_index = lc, sc
-                elif -1 in lc:
-                    sc_index, lc_index = sc, lc
-                else:
-                    sc_index = min(sc, lc)
-                    lc_index = max(sc, lc)
+        if self.start_char_rect_index is None or self.last_char_rect_index is None:
+            return page_dict
+
+        # handle forward select and backward select.
+        (sp_index, sc_index), (lp_index, lc_index) = sorted([
+            (self.start_char_page_index, self.start_char_rect_index),
+            (self.last_char_page_index, self.last_char_rect_index)])
+        for page_index in range(sp_index, lp_index + 1):
+            char_count = len(self.document[page_index].get_char_table())
+            if char_count == 0:
+                continue
 
-                page_dict[page_index] = self.document[page_index].get_obj_from_range(sc_index, lc_index)
+            start = sc_index if page_index == sp_index else 0
+            end = lc_index if page_index == lp_index else char_count - 1
+            page_dict[page_index] = (start, end)
 
         return page_dict
 
-    def parse_select_char_list(self):
-        string = ""
-        page_dict = self.get_select_char_list()
-        for index, chars_list in enumerate(page_dict.values()):
-            if chars_list:
-                string += "".join(list(map(lambda x: x["c"], chars_list)))
-
-                if index != 0:
-                    string += "\n\n"    # add new line on page end.
-        return string
-
     def parse_select_obj_list(self):
         strings = []
-        page_dict = self.get_select_obj_list()
-        for index, obj_list in enumerate(page_dict.values()):
-            if obj_list:
-                strings.append(self.document[index].parse_obj_list(obj_list))
-        return "".join(strings)
+        for page_index, (start, end) in self.get_select_char_ranges().items():
+            strings.append(self.document[page_index].get_select_text(start, end))
+        return "\n".join(strings)
 
     def record_new_annot_action(self, annot_action):
         num_action_removed = len(self.annot_action_sequence) - (self.annot_action_index + 1)
@@ -1357,7 +1816,7 @@ class PdfViewerWidget(QWidget):
             annot_action = AnnotAction.create_annot_action("Add", page_index, new_annot)
             self.record_new_annot_action(annot_action)
 
-        self.document.saveIncr()
+        self.save_annot(list(self.select_area_annot_quad_cache_dict.keys()))
         self.select_area_annot_quad_cache_dict.clear()
 
     def annot_popup_text_annot(self, text=None):
@@ -1373,7 +1832,7 @@ class PdfViewerWidget(QWidget):
         annot_action = AnnotAction.create_annot_action("Add", page_index, new_annot)
         self.record_new_annot_action(annot_action)
 
-        self.save_annot()
+        self.save_annot([page_index])
         self.disable_popup_text_annot_mode()    # type: ignore
 
     def compute_annot_rect_inline_text(self, point, fontsize, text):
@@ -1409,114 +1868,35 @@ class PdfViewerWidget(QWidget):
         annot_action = AnnotAction.create_annot_action("Add", page_index, new_annot)
         self.record_new_annot_action(annot_action)
 
-        self.save_annot()
+        self.save_annot([page_index])
         self.disable_inline_text_annot_mode()    # type: ignore
 
     def cleanup_select(self):
         self.is_select_mode = False
         self.delete_all_mark_select_area()
-        self.page_cache_pixmap_dict.clear()
         self.update()
 
-    def update_select_char_area(self):
-        page_dict = self.get_select_char_list()
-        for page_index, chars_list in page_dict.items():
-            # Using multi line rect make of abnormity select area.
-            line_rect_list = []
-            if chars_list:
-                # every char has bbox property store char rect.
-                bbox_list = list(map(lambda x: x["bbox"], chars_list))
-
-                # With char order is left to right, if the after char x-axis more than before
-                # char x-axis, will determine have "\n" between on both.
-                if len(bbox_list) >= 2:
-                    tl_x, tl_y = 0, 0 # top left point
-                    for index, bbox in enumerate(bbox_list[:-1]):
-                        if (tl_x == 0) or (tl_y == 0):
-                            tl_x, tl_y = bbox[:2]
-                        if bbox[0] > bbox_list[index + 1][2]:
-                            br_x, br_y = bbox[2:] # bottom right
-                            line_rect_list.append((tl_x, tl_y, br_x, br_y))
-                            tl_x, tl_y = 0, 0
-
-                    lc = bbox_list[-1]  # The last char
-                    line_rect_list.append((tl_x, tl_y, lc[2], lc[3]))
-                else:
-                    # if only one char selected.
-                    line_rect_list.append(bbox_list[0])
-
-            def check_rect(rect):
-                tl_x, tl_y, br_x, br_y = rect
-                if tl_x <= br_x and tl_y <= br_y:
-                    return fitz.Rect(rect)
-                # discard the illegal rect. return a micro rect
-                return fitz.Rect(tl_x, tl_y, tl_x+1, tl_y+1)
-
-            line_rect_list = list(map(check_rect, line_rect_list))
-
-            quad_list = list(map(lambda x: x.quad, line_rect_list))
-
-            # refresh select quad
-            self.select_area_annot_quad_cache_dict[page_index] = quad_list
-            
     def update_select_obj_area(self):
-        page_dict = self.get_select_obj_list()
         rectify = lambda x0, y0, x1, y1: fitz.Rect(x0-1, y0-1, x1+1, y1+1)
-        for page_index, chars_list in page_dict.items():         
-            rect_list = []
-            if not chars_list:
-                continue
-            
-            line_rect_list = []
-            line_x0, line_y0, line_x1, line_y1 = chars_list[0]["bbox"]
-            for obj in chars_list:
-                x0, y0, x1, y1 = obj["bbox"]
-                if abs(y0-line_y0) < 3 or abs(y1-line_y1) < 3 or \
-                    abs((y0+y1) / 2 - (line_y0 + line_y1)/2) < 3:
-                    # The same line
-                    line_x0 = min(line_x0, x0)
-                    line_y0 = min(line_y0, y0)
-                    line_x1 = max(line_x1, x1)
-                    line_y1 = max(line_y1, y1)
-                else:
-                    # The next line
-                    line_rect_list.append(rectify(line_x0, line_y0, line_x1, line_y1))
-                    line_x0, line_y0, line_x1, line_y1 = x0, y0, x1, y1
-            line_rect_list.append(rectify(line_x0, line_y0, line_x1, line_y1))  
+        for page_index, (start, end) in self.get_select_char_ranges().items():
+            line_rect_list = [rectify(*rect) for rect in self.document[page_index].get_select_rects(start, end)]
             # refresh select quad
             self.select_area_annot_quad_cache_dict[page_index] = line_rect_list
 
-    def mark_select_char_area(self, page_index, pixmap):
-        def quad_to_qrect(quad):
-            qrect = quad.rect * self.scale * self.devicePixelRatioF()
-            rect = QRect(int(qrect.x0), int(qrect.y0), int(qrect.width), int(qrect.height))
-            return rect
-
-        qp = QPainter(pixmap)
-        qp.setRenderHint(QPainter.RenderHint.Antialiasing)
-        if self.pdf_dark_mode:
-            qp.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceAtop)
-        else:
-            qp.setCompositionMode(QPainter.CompositionMode.CompositionMode_DestinationAtop)
-
-        # update select area quad list
-        self.update_select_char_area()
-
-        # draw new highlight
-        if page_index in self.select_area_annot_quad_cache_dict:
-            quads = self.select_area_annot_quad_cache_dict[page_index]
-            for quad in quads:
-                qp.fillRect(quad_to_qrect(quad), QColor(self.text_highlight_annot_color))
-
-        self.select_area_annot_quad_cache_dict.clear()
-        return pixmap
+    def draw_page_select_area(self, painter, page_index, rect, pixel_width):
+        '''Draw select area over page in rect, pixel_width is width of page in device pixel.'''
+        painter.save()
+        painter.translate(rect.x(), rect.y())
+        ratio = rect.width() / pixel_width
+        painter.scale(ratio, ratio)
+        self.draw_select_obj_area(painter, page_index)
+        painter.restore()
 
-    def mark_select_obj_area(self, page_index, pixmap):
+    def draw_select_obj_area(self, qp, page_index):
         def rect_to_qrect(rect):
             scaled =  rect * self.scale * self.devicePixelRatioF()
             return QRect(int(scaled.x0), int(scaled.y0), int(scaled.width), int(scaled.height))
 
-        qp = QPainter(pixmap)
         qp.setRenderHint(QPainter.RenderHint.Antialiasing)
         color = QColor(252, 240, 3, 60) if self.get_inverted_mode() else QColor(11, 120, 250, 60)
         qp.setBrush(color)
@@ -1534,7 +1914,6 @@ class PdfViewerWidget(QWidget):
                 qp.drawRoundedRect(rect_to_qrect(rect), 2.5, 2.5)
 
         self.select_area_annot_quad_cache_dict.clear()
-        return pixmap
 
     def delete_all_mark_select_area(self):
         self.last_char_page_index = None
@@ -1576,13 +1955,29 @@ class PdfViewerWidget(QWidget):
         self.is_hover_annot = annot is not None
 
         self.hovered_annot = annot
-        self.page_cache_pixmap_dict.pop(page_index, None)
+        if annot and annot.info["content"]:
+            QToolTip.showText(QCursor.pos(), annot.info["content"], None, QRect(), 10 * 1000)
+        elif QToolTip.isVisible():
+            QToolTip.hideText()
+
+        # Hovered annot is drawn in overlay, page pixmap is unchanged.
         self.update()
         return True
 
-    def save_annot(self):
+    def save_annot(self, pages=None):
+        '''Save annotations of pages, pages is None if page list of document changed.'''
         self.document.saveIncr()
-        self.page_cache_pixmap_dict.clear()
+        # Rasters on disk are the file before saved, new fingerprint is set when file watcher reload document.
+        self.disk_cache.set_document(None)
+        self.render_worker.reload()
+        if pages is None:
+            self.document.reset_cache()
+            self.invalidate_page_cache(reason="geometry")
+        else:
+            # Rebuild parsed pages, their annots and links are changed.
+            for index in pages:
+                self.document.remove_cache(index)
+            self.invalidate_page_cache(pages, "annotation")
         self.update()
 
     def annot_handler(self, action=None, annot=None):
@@ -1593,8 +1988,10 @@ class PdfViewerWidget(QWidget):
             if action == "delete":
                 annot_action = AnnotAction.create_annot_action("Delete", annot.parent.number, annot)
                 self.record_new_annot_action(annot_action)
+                page_index = annot.parent.number
                 annot.parent.delete_annot(annot)
-                self.save_annot()
+                self.hovered_annot = None
+                self.save_annot([page_index])
             elif action == "edit":
                 self.edited_annot_page = (annot, annot.parent)
                 atomic_edit(self.buffer_id, annot.info["content"].replace("\r", "\n"))
@@ -1618,7 +2015,7 @@ class PdfViewerWidget(QWidget):
                 annot.set_info(content=annot_text)    # type: ignore
                 message_to_emacs("Updated annot!")
             annot.update()    # type: ignore
-            self.save_annot()
+            self.save_annot([page.number])    # type: ignore
         self.edited_annot_page = (None, None)
 
     def move_annot_text(self):
@@ -1630,7 +2027,7 @@ class PdfViewerWidget(QWidget):
                 new_rect = fitz.Rect(point, point.x + rect.width, point.y + rect.height)    # type: ignore
                 annot.set_rect(new_rect)    # type: ignore
                 annot.update()    # type: ignore
-                self.save_annot()
+                self.save_annot([page.number])    # type: ignore
 
         self.moved_annot_page = (None, None)
         self.disable_move_text_annot_mode()
@@ -1649,16 +2046,8 @@ class PdfViewerWidget(QWidget):
 
         page = self.document[page_index]
 
-        is_hover_link = False
-        current_link = None
-
-        for link in page.get_links():
-            rect = link["from"]
-            x0, y0, x1, y1 = rect
-            if ex >= x0 and ex <= x1 and ey >= y0 and ey <= y1:
-                is_hover_link = True
-                current_link = link
-                break
+        current_link = page.get_link_at_point(ex, ey)
+        is_hover_link = current_link is not None
 
         # update and print message only if changed
         if (is_hover_link != self.is_hover_link or
@@ -1726,15 +2115,43 @@ class PdfViewerWidget(QWidget):
         return 100.0 * self.scroll_offset / (self.max_scroll_offset() + self.rect().height())
 
     def update_vertical_offset(self, new_offset):
+        if self.is_blit_scroll_enabled() and abs(new_offset - self.scroll_offset) < self.rect().height():
+            # Scroll whole pixels, painted pixels can be reused.
+            new_offset = self.scroll_offset + round(new_offset - self.scroll_offset)
         new_offset = max(0, min(new_offset, self.max_scroll_offset()))
         eval_in_emacs("eaf--clear-message", [])
         if self.scroll_offset != new_offset:
+            self.restored_page_position = None
+            scroll_y = self.scroll_offset - new_offset
             self.scroll_offset = new_offset
-            self.update()
+            if self.is_blit_scroll_enabled() and scroll_y == int(scroll_y) and abs(scroll_y) < self.rect().height():
+                self.blit_scroll(int(scroll_y))
+            else:
+                self.update()
             eval_in_emacs("eaf--pdf-update-position", [self.buffer_id,
                                             self.current_page_index1,
                                             self.page_total_number])
             
+    def is_blit_scroll_enabled(self):
+        # Logical pixel is not whole device pixel with fractional HiDPI scale, pixels can't be scrolled exactly.
+        return self.read_mode != "fit_to_presentation" and self.devicePixelRatioF().is_integer()
+
+    def blit_scroll(self, scroll_y):
+        '''Move pixels of viewport pixmap by scroll_y, paintEvent only paint exposed strip.'''
+        if self.viewport_pixmap is not None and not self.is_viewport_dirty:
+            hidpi_scale_factor = int(self.viewport_pixmap.devicePixelRatio())
+            self.viewport_pixmap.scroll(0, scroll_y * hidpi_scale_factor, self.viewport_pixmap.rect())
+
+            # Strip that not painted yet moves with pixels too.
+            if scroll_y > 0:
+                strip_rect = QRect(0, 0, self.width(), scroll_y)
+            else:
+                strip_rect = QRect(0, self.height() + scroll_y, self.width(), -scroll_y)
+            self.viewport_exposed_rect = self.viewport_exposed_rect.translated(0, scroll_y).intersected(self.rect()).united(strip_rect)
+
+        # Don't mark viewport dirty, whole widget is shown from viewport pixmap.
+        super().update()
+
     def update_horizontal_offset(self, new_offset):
         eval_in_emacs("eaf--clear-message", [])
         if self.horizontal_offset != new_offset:
@@ -1776,13 +2193,7 @@ class PdfViewerWidget(QWidget):
         if page_index is None:
             return None
 
-        page = self.document[page_index]
-        for link in page.get_links():
-            rect = link["from"]
-            if ex >= rect.x0 and ex <= rect.x1 and ey >= rect.y0 and ey <= rect.y1:
-                return link
-
-        return None
+        return self.document[page_index].get_link_at_point(ex, ey)
 
     def get_double_click_word(self):
         ex, ey, page_index = self.get_cursor_absolute_position()
@@ -1791,12 +2202,46 @@ class PdfViewerWidget(QWidget):
         page = self.document[page_index]
         word_offset = 10 # 10 pixel is enough for word intersect operation
         draw_rect = fitz.Rect(ex, ey, ex + word_offset, ey + word_offset)
+        return page.get_word_at_rect(draw_rect)
+
+    def handle_mouse_move(self):
+        ex, ey, page_index = self.get_cursor_absolute_position()
+        is_hover_mode = self.hasMouseTracking() and not self.is_rect_annot_mode and not self.is_move_text_annot_mode
+
+        if is_hover_mode and self.mouse_hover_area is not None and page_index is not None:
+            page, rect, shape = self.mouse_hover_area
+            if page is self.document.get_cached_page(page_index) and rect.x0 < ex < rect.x1 and rect.y0 < ey < rect.y1:
+                self.set_cursor_shape(shape)
+                return
+        self.mouse_hover_area = None
+
+        shape = Qt.CursorShape.ArrowCursor
+        if self.check_selectable((ex, ey, page_index)):
+            shape = Qt.CursorShape.IBeamCursor
+        if not self.is_rect_annot_mode:
+            if self.hasMouseTracking():
+                if self.check_annot((ex, ey, page_index)) or self.hover_link((ex, ey, page_index)):
+                    shape = Qt.CursorShape.PointingHandCursor
+
+                if is_hover_mode and shape != Qt.CursorShape.ArrowCursor:
+                    page = self.document[page_index]
+                    rect = page.get_hover_rect(ex, ey)
+                    if rect is not None:
+                        self.mouse_hover_area = (page, rect, shape)
+            else:
+                self.handle_select_mode((ex, ey, page_index))
+        self.set_cursor_shape(shape)
+
+    def set_cursor_shape(self, shape):
+        # Change override cursor only when shape changed, don't push cursor stack on every move.
+        if shape == self.cursor_shape:
+            return
 
-        page.set_cropbox(page.rect)
-        page_words = page.get_text_words()
-        rect_words = [w for w in page_words if fitz.Rect(w[:4]).intersects(draw_rect)]
-        if rect_words:
-            return rect_words[0][4]
+        if self.cursor_shape is None:
+            QApplication.setOverrideCursor(shape)
+        else:
+            QApplication.changeOverrideCursor(QCursor(shape))
+        self.cursor_shape = shape
 
     def eventFilter(self, obj, event):
         if event.type() in [QEvent.Type.MouseButtonPress]:
@@ -1805,17 +2250,9 @@ class PdfViewerWidget(QWidget):
             self.is_button_press = False
 
         if event.type() == QEvent.Type.MouseMove:
-            shape = Qt.CursorShape.ArrowCursor
-            ex, ey, page_index = self.get_cursor_absolute_position()
-            if self.check_selectable((ex, ey, page_index)):
-                shape = Qt.CursorShape.IBeamCursor
-            if not self.is_rect_annot_mode:
-                if self.hasMouseTracking():
-                    if self.check_annot((ex, ey, page_index)) or self.hover_link((ex, ey, page_index)):
-                        shape = Qt.CursorShape.PointingHandCursor
-                else:
-                    self.handle_select_mode((ex, ey, page_index))
-            QApplication.setOverrideCursor(shape)
+            # Coalesce move events, mouse report rate is much higher than frame rate.
+            if not self.mouse_move_timer.isActive():
+                self.mouse_move_timer.start()
 
         elif event.type() == QEvent.Type.MouseButtonPress:
             # add this detect release mouse event
@@ -1865,6 +2302,11 @@ class PdfViewerWidget(QWidget):
                     self.jump_to_previous_saved_pos()
 
         elif event.type() == QEvent.Type.MouseButtonRelease:
+            # Handle pending move first, select area ends at release position.
+            if self.mouse_move_timer.isActive():
+                self.mouse_move_timer.stop()
+                self.handle_mouse_move()
+
             # Capture move event, event without holding down the mouse.
             self.setMouseTracking(True)
             self.releaseMouse()
@@ -1967,7 +2409,7 @@ class PdfViewerWidget(QWidget):
                 annot_action = AnnotAction.create_annot_action("Add", page_index, new_annot)
                 self.record_new_annot_action(annot_action)
 
-                self.save_annot()
+                self.save_annot([page_index])
                 self.disable_rect_annot_mode()
 
     def enable_move_text_annot_mode(self):
@@ -2002,10 +2444,10 @@ class PdfViewerWidget(QWidget):
         if page_index is None:
             return
         rect_index = self.document[page_index].get_page_obj_rect_index(ex, ey)
-        if rect_index:
+        if rect_index is not None:
             if self.start_char_rect_index is None or self.start_char_page_index is None:
                 self.start_char_rect_index, self.start_char_page_index = rect_index, page_index
-            else:
+            elif (rect_index, page_index) != (self.last_char_rect_index, self.last_char_page_index):
                 self.last_char_rect_index, self.last_char_page_index = rect_index, page_index
                 self.update()
                 
@@ -2056,4 +2498,18 @@ class PdfViewerWidget(QWidget):
         message_to_emacs("Updated PDF Table of Contents successfully.")
 
     def build_reverse_index(self):
-        return self.document.build_reverse_index()
\ No newline at end of file
+        return self.document.build_reverse_index()
+
+    @interactive
+    def show_render_cache_stats(self):
+        stats = self.page_cache.stats()
+        invalidations = ", ".join("{} {}".format(reason, count) for reason, count in stats["invalidations"].items())
+        message_to_emacs("Render cache: {} pages, {:.1f}/{:.0f} MB, hits {}, misses {}, evictions {}, invalidations: {}".format(
+            stats["entries"], stats["bytes"] / 1024 / 1024, stats["max_bytes"] / 1024 / 1024,
+            stats["hits"], stats["misses"], stats["evictions"], invalidations or "none"))
+
+    @interactive
+    def show_page_cache_stats(self):
+        stats = self.document.get_page_cache_stats()
+        message_to_emacs("Page cache: {}/{} pages, hits {}, misses {}, evictions {}".format(
+            stats["entries"], stats["max_count"], stats["hits"], stats["misses"], stats["evictions"]))
\ No newline at end of file